@@ -0,0 +1,7 @@
+# app/api/db_pool.py
+from src.data.db import get_pool
+
+
+def acquire():
+    """Presta un cursor del pool compartido del proceso (ver src.data.db.DuckPool)."""
+    return get_pool().acquire()
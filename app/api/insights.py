@@ -1,26 +1,48 @@
-from fastapi import APIRouter, Query, HTTPException
-from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, Query, HTTPException
+from fastapi.responses import ORJSONResponse
+from typing import Optional, Tuple
+from cachetools.func import ttl_cache
 from src.insights.engine import generate_insights
-from src.insights.report import save_report
+from src.insights.report import save_report, report_id, report_paths, REPORT_ID_PATTERN
 
 router = APIRouter(prefix="/insights", tags=["insights"])
 
-@router.get("/")
-def get_insights(country: Optional[str] = Query(default=None),
+ScopeKey = Tuple[Optional[str], Optional[str], Optional[str]]
+
+def _scope_key(country: Optional[str], city: Optional[str], zone: Optional[str]) -> ScopeKey:
+    # normaliza a mayúsculas (tu DuckDB usa UPPER() en filtros internos); vacío -> None
+    return tuple((v.strip().upper() or None) if v else None for v in (country, city, zone))
+
+@ttl_cache(maxsize=128, ttl=600)
+def _insights_cached(key: ScopeKey):
+    """Payload por scope (country, city, zone); 10 min o hasta /cache/invalidate."""
+    country, city, zone = key
+    return generate_insights({"country": country, "city": city, "zone": zone})
+
+# `def` (no `async def`): el motor de insights es bloqueante y debe ir al threadpool.
+@router.get("/", response_class=ORJSONResponse)
+def get_insights(background_tasks: BackgroundTasks,
+                 country: Optional[str] = Query(default=None),
                  city: Optional[str] = Query(default=None),
                  zone: Optional[str] = Query(default=None),
-                 save: bool = Query(default=True)):
+                 save: bool = Query(default=True),
+                 defer: bool = Query(default=False)):
     try:
-        # normaliza a mayúsculas (tu DuckDB usa UPPER() en filtros internos)
-        scope = {
-            "country": country.upper() if country else None,
-            "city": city.upper() if city else None,
-            "zone": zone.upper() if zone else None,
-        }
-        payload = generate_insights(scope)
+        payload = _insights_cached(_scope_key(country, city, zone))
+        if save and defer:
+            # Escritura a disco fuera del camino de respuesta; rutas vía /insights/files?id=...
+            rid = report_id()
+            background_tasks.add_task(save_report, payload, ts=rid)
+            return {"insights": payload, "files": None, "report_id": rid}
         paths = save_report(payload) if save else None
         return {"insights": payload, "files": paths}
     except Exception as e:
         # Evita 500 opaco hacia Streamlit
         raise HTTPException(status_code=400, detail=f"Insights error: {repr(e)}")
 
+@router.get("/files")
+def get_insight_files(id: str = Query(..., pattern=REPORT_ID_PATTERN)):
+    paths = report_paths(id)
+    if not all(p.exists() for p in paths.values()):
+        raise HTTPException(status_code=404, detail=f"Reporte {id} aún no disponible")
+    return {k: str(p) for k, p in paths.items()}
@@ -1,36 +1,101 @@
 # app/api/main.py
+import hashlib
+import json
+import threading
+from contextlib import asynccontextmanager
+from typing import Tuple
+
+from anyio import to_thread
+from cachetools import LRUCache, TTLCache
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
+from src.config import API_THREADPOOL_SIZE
+
 from src.bot.memory import Memory
 from src.bot.parser import to_spec_llm, to_spec
 from src.bot.executor import execute
 
 # importa el router de insights
-from app.api.insights import router as insights_router
+from app.api.insights import router as insights_router, _insights_cached
+from app.api.routers.metrics import router as metrics_router, _summary
+from app.api.routers.metrics_timeseries import router as timeseries_router, _orders_series
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # Las rutas son `def` (DuckDB/OpenAI bloquean): Starlette las corre en este pool.
+    to_thread.current_default_thread_limiter().total_tokens = API_THREADPOOL_SIZE
+    yield
 
 # 1) crea la app primero
-app = FastAPI(title="Rappi Intelligent Ops - API")
+app = FastAPI(title="Rappi Intelligent Ops - API", default_response_class=ORJSONResponse,
+              lifespan=_lifespan)
 
 # 2) registra routers después de crear la app
 app.include_router(insights_router)
+app.include_router(metrics_router)
+app.include_router(timeseries_router)
+
 
 # --- Chat API ---
-MEM = Memory()
+# Memoria conversacional por sesión (30 min de inactividad), cada una con su propio lock
+SESSIONS = TTLCache(maxsize=10_000, ttl=1800)
+_SESSIONS_LOCK = threading.Lock()
+
+def _session(session_id: str) -> Tuple[Memory, threading.Lock]:
+    with _SESSIONS_LOCK:
+        entry = SESSIONS.get(session_id)
+        if entry is None:
+            entry = SESSIONS[session_id] = (Memory(), threading.Lock())
+        return entry
+
+# Cache exacta: misma pregunta + modo + memoria => mismo spec y mismo resultado.
+CHAT_CACHE = LRUCache(maxsize=512)
+_CHAT_CACHE_LOCK = threading.Lock()
+
+def _chat_key(question: str, use_llm: bool, memory: dict) -> bytes:
+    raw = json.dumps([question, use_llm, sorted(memory.items())])
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
 
 class ChatIn(BaseModel):
     question: str
     use_llm: bool = True
+    session_id: str = "default"
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+@app.post("/cache/invalidate")
+def cache_invalidate():
+    """Vacía las caches de respuestas; llamar tras re-correr el ETL."""
+    _summary.cache_clear()
+    _orders_series.cache_clear()
+    _insights_cached.cache_clear()
+    with _CHAT_CACHE_LOCK:
+        CHAT_CACHE.clear()
+    return {"status": "ok"}
+
+# `def` a propósito: LLM + DuckDB son bloqueantes; con `async def` frenarían el event loop.
 @app.post("/chat")
 def chat(inp: ChatIn):
-    memory = MEM.get()
-    spec = to_spec_llm(inp.question, memory) if inp.use_llm else to_spec(inp.question, memory)
-    MEM.update_from_spec(spec)
-    result = execute(spec)
-    return {"spec": spec.model_dump(), "result": result}
+    mem, lock = _session(inp.session_id)
+    # Serializa solo los turnos de la misma sesión; sesiones distintas corren en paralelo
+    with lock:
+        memory = mem.get()
+        key = _chat_key(inp.question, inp.use_llm, memory)
+        with _CHAT_CACHE_LOCK:
+            hit = CHAT_CACHE.get(key)
+        if hit is not None:
+            spec, result = hit
+            mem.update_from_spec(spec)
+            return {"spec": spec.model_dump(), "result": result}
 
+        spec = to_spec_llm(inp.question, memory) if inp.use_llm else to_spec(inp.question, memory)
+        mem.update_from_spec(spec)
+        result = execute(spec)
+        if "error" not in result:
+            with _CHAT_CACHE_LOCK:
+                CHAT_CACHE[key] = (spec, result)
+        return {"spec": spec.model_dump(), "result": result}
@@ -1,7 +1,9 @@
+from functools import lru_cache
+from itertools import product
 from typing import Optional
 from fastapi import APIRouter, Query
 from pydantic import BaseModel
-from src.data.db import get_conn
+from app.api.db_pool import acquire
 
 router = APIRouter(prefix="/metrics", tags=["metrics"])
 
@@ -12,29 +14,39 @@ class MetricsSummary(BaseModel):
     total_orders: int
     avg_gross_profit_ue: float
 
-@router.get("", response_model=MetricsSummary)
-def metrics_summary(
-    country: Optional[str] = Query(None, description="CO, MX, AR..."),
-    zone: Optional[str]   = Query(None, description="BOG, LIM..."),
-    week: Optional[int]   = Query(None, ge=0, le=52),
-):
-    where, params = [], []
-    if country: where.append("country = ?"); params.append(country)
-    if zone:    where.append("zone = ?");    params.append(zone)
-    if week is not None: where.append("week = ?"); params.append(week)
+def _build_sql(has_country: bool, has_zone: bool, has_week: bool) -> str:
+    where = []
+    if has_country: where.append("country = ?")
+    if has_zone:    where.append("zone = ?")
+    if has_week:    where.append("week = ?")
     w = ("WHERE " + " AND ".join(where)) if where else ""
-
-    sql = f"""
+    return f"""
       SELECT COALESCE(SUM(orders),0)::INT AS total_orders,
              COALESCE(AVG(gross_profit_ue),0.0) AS avg_gross_profit_ue
       FROM ops.metrics
       {w}
     """
-    con = get_conn()
-    row = con.execute(sql, params).fetchone()
-    con.close()
+
+# Las 8 formas posibles de filtro, construidas una vez al importar
+_SQL = {shape: _build_sql(*shape) for shape in product((False, True), repeat=3)}
+
+@lru_cache(maxsize=1024)
+def _summary(country: Optional[str], zone: Optional[str], week: Optional[int]):
+    """(total_orders, avg_gross_profit_ue) por filtro; cacheado hasta /cache/invalidate."""
+    sql = _SQL[(bool(country), bool(zone), week is not None)]
+    params = [v for v in (country or None, zone or None, week) if v is not None]
+    with acquire() as cur:
+        row = cur.execute(sql, params).fetchone()
     total = int(row[0]) if row and row[0] is not None else 0
     avggp = float(row[1]) if row and row[1] is not None else 0.0
+    return total, avggp
+
+@router.get("", response_model=MetricsSummary)
+def metrics_summary(
+    country: Optional[str] = Query(None, description="CO, MX, AR..."),
+    zone: Optional[str]   = Query(None, description="BOG, LIM..."),
+    week: Optional[int]   = Query(None, ge=0, le=52),
+):
+    total, avggp = _summary(country, zone, week)
     return MetricsSummary(country=country, zone=zone, week=week,
                           total_orders=total, avg_gross_profit_ue=avggp)
-
@@ -1,7 +1,9 @@
+from functools import lru_cache
+from itertools import product
 from typing import Optional, List
 from fastapi import APIRouter, Query
 from pydantic import BaseModel
-from src.data.db import get_conn
+from app.api.db_pool import acquire
 
 router = APIRouter(prefix="/timeseries", tags=["metrics"])
 
@@ -9,28 +11,41 @@ class Point(BaseModel):
     week: int
     orders: int
 
-@router.get("/orders", response_model=List[Point])
-def orders_ts(
-    country: Optional[str] = Query(None),
-    zone: Optional[str] = Query(None),
-):
+def _build_sql(has_country: bool, has_zone: bool) -> str:
     where = []
-    params = []
-    if country:
+    if has_country:
         where.append("country = ?")
-        params.append(country)
-    if zone:
+    if has_zone:
         where.append("zone = ?")
-        params.append(zone)
     w = ("WHERE " + " AND ".join(where)) if where else ""
-    sql = f"""
+    return f"""
         SELECT week::INT AS week, SUM(orders)::INT AS orders
         FROM ops.metrics
         {w}
         GROUP BY week
         ORDER BY week
     """
-    con = get_conn()
-    rows = con.execute(sql, params).fetchall()
-    con.close()
-    return [{"week": int(w), "orders": int(o)} for (w, o) in rows]
+
+# Las 4 formas posibles de filtro, construidas una vez al importar
+_SQL = {shape: _build_sql(*shape) for shape in product((False, True), repeat=2)}
+
+@lru_cache(maxsize=1024)
+def _orders_series(country: Optional[str], zone: Optional[str]):
+    """Serie ((week, orders), ...) por filtro; cacheada hasta /cache/invalidate."""
+    sql = _SQL[(bool(country), bool(zone))]
+    params = [v for v in (country, zone) if v]
+    weeks, orders = [], []
+    with acquire() as cur:
+        # lotes Arrow de 1024 filas: no se materializa todo el resultado de una vez
+        reader = cur.execute(sql, params).fetch_record_batch(rows_per_batch=1024)
+        for batch in reader:
+            weeks.extend(batch.column(0).to_pylist())
+            orders.extend(batch.column(1).to_pylist())
+    return tuple(zip(weeks, orders))
+
+@router.get("/orders", response_model=List[Point])
+def orders_ts(
+    country: Optional[str] = Query(None),
+    zone: Optional[str] = Query(None),
+):
+    return [{"week": w, "orders": o} for (w, o) in _orders_series(country, zone)]
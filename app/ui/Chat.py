@@ -1,10 +1,9 @@
 import os
-import json
-import hashlib
+import uuid
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import requests
+import plotly.graph_objects as go
+from ui_http import http_session
 
 st.set_page_config(page_title="Chat de Datos - Rappi", layout="wide")
 st.title("Chat de Datos — Rappi Intelligent Ops")
@@ -14,36 +13,36 @@ API_BASE = os.getenv("API_BASE", "http://127.0.0.1:8001")  # ajusta si tu API es
 # Estado inicial
 if "history" not in st.session_state:
     st.session_state.history = []
-if "plot_counter" not in st.session_state:
-    st.session_state.plot_counter = 0
-if "table_counter" not in st.session_state:
-    st.session_state.table_counter = 0
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 
 q = st.text_input("Escribe tu pregunta (ej.: Top 5 zonas con mayor Lead Penetration esta semana en Colombia)")
 use_llm = st.toggle("Usar LLM para parseo", value=False)  # pon True si ya tienes OPENAI_API_KEY
 
+# ---------- Helpers UI ----------
+def _chart_key(turn_id: int, suffix: str) -> str:
+    # Solo se necesita unicidad y turn_id ya identifica el turno: sin hash.
+    return f"plot-{turn_id}-{suffix}"
+
 if st.button("Enviar") and q:
     try:
-        r = requests.post(f"{API_BASE}/chat", json={"question": q, "use_llm": use_llm}, timeout=60)
+        body = {"question": q, "use_llm": use_llm, "session_id": st.session_state.session_id}
+        r = http_session().post(f"{API_BASE}/chat", json=body, timeout=60)
         r.raise_for_status()
         payload = r.json()
-        st.session_state.history.append({"q": q, "payload": payload})
+        # Keys de gráficas calculadas una sola vez, no en cada rerun
+        turn_id = len(st.session_state.history)
+        keys = {"bar": _chart_key(turn_id, "bar"), "line": _chart_key(turn_id, "line")}
+        turn = {"id": turn_id, "q": q, "payload": payload, "keys": keys}
+        # DataFrame y CSV son funciones puras del payload: se construyen una vez al recibirlo
+        data = payload.get("result", {}).get("data", [])
+        if data:
+            turn["df"] = pd.DataFrame(data)
+            turn["csv"] = turn["df"].to_csv(index=False).encode("utf-8")
+        st.session_state.history.append(turn)
     except Exception as e:
         st.error(f"Error llamando API: {e}")
 
-# ---------- Helpers UI ----------
-def _chart_key(title: str, payload_obj: dict, suffix: str) -> str:
-    raw = json.dumps({"t": title, "s": payload_obj, "sfx": suffix}, sort_keys=True)
-    return "plot-" + hashlib.md5(raw.encode()).hexdigest()[:10]
-
-def _table_key(idx: int) -> str:
-    st.session_state.table_counter += 1
-    return f"table-{idx}-{st.session_state.table_counter}"
-
-def _next_plot_key(idx: int, suffix: str) -> str:
-    st.session_state.plot_counter += 1
-    return f"plot-{idx}-{st.session_state.plot_counter}-{suffix}"
-
 # ---------- Render historial ----------
 for i, turn in enumerate(reversed(st.session_state.history)):
     st.markdown(f"**Tú:** {turn['q']}")
@@ -71,10 +70,10 @@ for i, turn in enumerate(reversed(st.session_state.history)):
         st.info("Sin datos para mostrar con este filtro/consulta.")
         continue
 
-    df = pd.DataFrame(data)
+    df = turn["df"]
 
     # ---- Tabla (con key único) ----
-    st.dataframe(df, use_container_width=True, key=_table_key(i))
+    st.dataframe(df, use_container_width=True, key=f"table-{turn['id']}")
 
     # ---- Gráfica (con key único y columnas tolerantes) ----
     viz = res.get("visualization")
@@ -87,11 +86,13 @@ for i, turn in enumerate(reversed(st.session_state.history)):
         x_candidates = [c for c in ["grp", "ZONE", "CITY", "COUNTRY"] if c in df.columns]
         xcol = x_candidates[0] if x_candidates else None
         if xcol and value_col:
-            fig = px.bar(df, x=xcol, y=value_col)
+            # graph_objects + arrays numpy: sin la copia/inferencia de plotly.express en cada rerun
+            fig = go.Figure(go.Bar(x=df[xcol].to_numpy(), y=df[value_col].to_numpy()))
+            fig.update_layout(xaxis_title=xcol, yaxis_title=value_col)
             st.plotly_chart(
                 fig,
                 use_container_width=True,
-                key=_next_plot_key(i, f"bar-{xcol}-{value_col}")
+                key=turn["keys"]["bar"]
             )
 
     elif viz == "line":
@@ -104,20 +105,26 @@ for i, turn in enumerate(reversed(st.session_state.history)):
                 color = c
                 break
         if xcol and ycol:
-            fig = px.line(df, x=xcol, y=ycol, color=color)
+            fig = go.Figure()
+            groups = df.groupby(color, sort=False) if color else [(None, df)]
+            for name, g in groups:
+                fig.add_trace(go.Scatter(x=g[xcol].to_numpy(), y=g[ycol].to_numpy(), mode="lines",
+                                         name=str(name) if color else ycol))
+            fig.update_layout(xaxis_title=xcol, yaxis_title=ycol, legend_title_text=color or "",
+                              showlegend=bool(color))
             st.plotly_chart(
                 fig,
                 use_container_width=True,
-                key=_next_plot_key(i, f"line-{xcol}-{ycol}-{color or 'none'}")
+                key=turn["keys"]["line"]
             )
 
     # ---- Descarga (key único) ----
     st.download_button(
         "Descargar CSV",
-        df.to_csv(index=False).encode("utf-8"),
+        turn["csv"],
         file_name=f"resultado_{i}.csv",
         mime="text/csv",
-        key=f"download_csv_{i}",
+        key=f"download_csv_{turn['id']}",
     )
 
     # ---- Sugerencias ----
@@ -1,5 +1,5 @@
 import streamlit as st
-import requests
+from ui_http import http_session
 import os
 
 st.set_page_config(page_title="Rappi Intelligent Ops", layout="wide")
@@ -19,7 +19,7 @@ q = {"country": country, "zone": zone, "week": int(week)}
 
 if run:
     try:
-        r = requests.get(f"{API_BASE}/metrics", params=q, timeout=10)
+        r = http_session().get(f"{API_BASE}/metrics", params=q, timeout=10)
         if r.ok:
             st.success("OK")
             st.write(r.json())
@@ -1,7 +1,7 @@
 # app/ui/Insights.py
 import streamlit as st
 import pandas as pd
-import requests
+from ui_http import http_session
 from pathlib import Path
 
 st.set_page_config(page_title="Insights Automáticos", layout="wide")
@@ -9,6 +9,11 @@ st.title("Insights Automáticos — Rappi Intelligent Ops")
 
 API_BASE = "http://127.0.0.1:8001"  # tu API en 8001
 
+@st.cache_data
+def _file_bytes(path: str, mtime: float) -> bytes:
+    # mtime en la firma: si el archivo se reescribe, se vuelve a leer
+    return Path(path).read_bytes()
+
 col1, col2, col3 = st.columns(3)
 country = col1.text_input("País (opcional, ej. CO/MX/PE)")
 city    = col2.text_input("Ciudad (opcional)")
@@ -21,7 +26,7 @@ if st.button("Generar insights"):
         if city: params["city"] = city
         if zone: params["zone"] = zone
         try:
-            r = requests.get(f"{API_BASE}/insights/", params=params, timeout=180)
+            r = http_session().get(f"{API_BASE}/insights/", params=params, timeout=180)
             r.raise_for_status()
             payload = r.json()
             insights = payload["insights"]
@@ -53,17 +58,14 @@ if st.button("Generar insights"):
                 st.markdown("#### Descargas")
                 md = files.get("markdown"); html = files.get("html"); js = files.get("json")
                 if md and Path(md).exists():
-                    with open(md, "r", encoding="utf-8") as f:
-                        st.download_button("Descargar Markdown", f.read().encode("utf-8"),
-                                           file_name=Path(md).name, mime="text/markdown", key="dl_md")
+                    st.download_button("Descargar Markdown", _file_bytes(md, Path(md).stat().st_mtime),
+                                       file_name=Path(md).name, mime="text/markdown", key="dl_md")
                 if html and Path(html).exists():
-                    with open(html, "r", encoding="utf-8") as f:
-                        st.download_button("Descargar HTML", f.read().encode("utf-8"),
-                                           file_name=Path(html).name, mime="text/html", key="dl_html")
+                    st.download_button("Descargar HTML", _file_bytes(html, Path(html).stat().st_mtime),
+                                       file_name=Path(html).name, mime="text/html", key="dl_html")
                 if js and Path(js).exists():
-                    with open(js, "r", encoding="utf-8") as f:
-                        st.download_button("Descargar JSON", f.read().encode("utf-8"),
-                                           file_name=Path(js).name, mime="application/json", key="dl_json")
+                    st.download_button("Descargar JSON", _file_bytes(js, Path(js).stat().st_mtime),
+                                       file_name=Path(js).name, mime="application/json", key="dl_json")
         except Exception as e:
             st.error(f"Error llamando API: {e}")
 
@@ -0,0 +1,20 @@
+# app/ui/ui_http.py
+# Helpers HTTP compartidos por las páginas de Streamlit.
+# (No se llama `http.py`: streamlit pone app/ui en sys.path y taparía el `http` de la stdlib.)
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+# Tamaño del pool keep-alive hacia la API (por sesión de Streamlit)
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 8
+
+def http_session() -> requests.Session:
+    # Sesión HTTP reutilizada entre reruns: keep-alive en vez de un handshake por click
+    if "http" not in st.session_state:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        st.session_state.http = session
+    return st.session_state.http
@@ -0,0 +1,2 @@
+# src/bot/__init__.py
+__all__ = ["executor", "memory", "metrics", "parser", "schema", "text_utils"]
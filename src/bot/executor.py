@@ -1,17 +1,22 @@
 # src/bot/executor.py
-from typing import Dict, Any, List, Tuple, Optional
+from typing import Callable, Dict, Any, List, NamedTuple, Tuple, Optional
 import re
 import os
-import duckdb
+from functools import lru_cache
+from itertools import product
+from src.data.db import get_pool
 from .schema import AnalyticsSpec
-
-# Ruta por defecto a la base DuckDB
-DUCK = "data/processed/warehouse.duckdb"
+from .metrics import CAT
 
 
 # -----------------------------
 # Helpers de tiempo y filtros
 # -----------------------------
+_RE_LW0 = re.compile(r"L(\d+)W-L0W")
+_RE_LWLW = re.compile(r"L(\d+)W-L(\d+)W")
+
+
+@lru_cache(maxsize=64)
 def _offset_bounds(range_str: Optional[str]) -> Tuple[int, int]:
     """
     Convierte 'LkW-L0W' o 'L0W' a límites (lo, hi) de WEEK_OFFSET.
@@ -26,12 +31,12 @@ def _offset_bounds(range_str: Optional[str]) -> Tuple[int, int]:
     r = range_str.strip().upper()
     if r == "L0W":
         return (0, 0)
-    m = re.fullmatch(r"L(\d+)W-L0W", r)
+    m = _RE_LW0.fullmatch(r)
     if m:
         n = int(m.group(1))
         return (0, max(n - 1, 0))
     # Soporta también 'LkW-LmW' genérico si algún día lo usas (opcional)
-    m2 = re.fullmatch(r"L(\d+)W-L(\d+)W", r)
+    m2 = _RE_LWLW.fullmatch(r)
     if m2:
         a, b = int(m2.group(1)), int(m2.group(2))
         lo, hi = min(a, b), max(a, b)
@@ -39,38 +44,79 @@ def _offset_bounds(range_str: Optional[str]) -> Tuple[int, int]:
     return (0, 0)
 
 
+@lru_cache(maxsize=64)
 def _pretty_range(r: Optional[str]) -> str:
     r = (r or "").strip().upper()
     if r == "L0W":
         return "Week 0 (actual)"
-    m = re.fullmatch(r"L(\d+)W-L0W", r)
+    m = _RE_LW0.fullmatch(r)
     if m:
         return f"Últimas {int(m.group(1))} semanas"
     return r or "L0W"
 
 
-def _filters_where(f: Dict[str, Any]) -> str:
+_FILTER_DIMS = ("country", "city", "zone", "zone_type")
+
+
+def _filters_key(f: Any) -> Tuple[Tuple[str, str], ...]:
+    """
+    Clave hashable y normalizada (mayúsculas; ZONE_TYPE sin guion) de los filtros.
+    Acepta el modelo `Filters` (se leen los atributos, sin `model_dump`) o un dict.
+    """
+    get = f.get if isinstance(f, dict) else (lambda k: getattr(f, k, None))
+    key = []
+    for k in _FILTER_DIMS:
+        v = get(k)
+        if v:
+            v = str(v).upper()
+            if k == "zone_type":
+                v = v.replace("-", " ").strip()
+            key.append((k, v))
+    return tuple(key)
+
+
+@lru_cache(maxsize=256)
+def _filters_where(key: Tuple[Tuple[str, str], ...]) -> Tuple[str, Tuple[str, ...]]:
     """
-    Construye condiciones AND ...; robusto a ZONE_TYPE con/sin guion.
+    Construye condiciones AND ... con placeholders `?` y sus parámetros
+    a partir de `_filters_key`; robusto a ZONE_TYPE con/sin guion.
     """
     w = ""
-    if f.get("country"):
-        w += f" AND UPPER(COUNTRY)=UPPER('{f['country']}')"
-    if f.get("city"):
-        w += f" AND UPPER(CITY)=UPPER('{f['city']}')"
-    if f.get("zone"):
-        w += f" AND UPPER(ZONE)=UPPER('{f['zone']}')"
-    if f.get("zone_type"):
-        zt = f["zone_type"].upper().replace("-", " ").strip()
-        w += f" AND REPLACE(UPPER(ZONE_TYPE),'-',' ') = '{zt}'"
-    # Si más adelante soportas otras dimensiones filtrables, añádelas aquí.
-    return w
+    for k, _ in key:
+        if k == "zone_type":
+            w += " AND REPLACE(UPPER(ZONE_TYPE),'-',' ') = ?"
+        else:
+            w += f" AND UPPER({k.upper()})=?"
+    # Si más adelante soportas otras dimensiones filtrables, añádelas en _FILTER_DIMS.
+    return w, tuple(v for _, v in key)
+
+
+# data_name del catálogo (tal como aparece en la columna METRIC), indexado en minúsculas
+_DATA_NAME_BY_LOWER = {m["data_name"].lower(): m["data_name"]
+                       for m in CAT.get("metrics", {}).values()}
+
+
+def _metric_where(metrics: List[str]) -> Tuple[str, List[str]]:
+    # Si todas las métricas están en el catálogo se compara exacto contra METRIC
+    # (sin LOWER por fila); si no, se mantiene la comparación en minúsculas.
+    canon = [_DATA_NAME_BY_LOWER.get((m or "").lower()) for m in metrics]
+    if metrics and all(canon):
+        placeholders = ", ".join(["?"] * len(canon))
+        return f"AND METRIC IN ({placeholders})", canon
+    placeholders = ", ".join(["LOWER(?)"] * len(metrics))
+    return f"AND LOWER(METRIC) IN ({placeholders})", list(metrics)
 
 
-def _metric_where(metrics: List[str]) -> str:
-    # Compara en minúsculas contra METRIC textual
-    safe = ", ".join([f"LOWER('{m}')" for m in metrics])
-    return f"AND LOWER(METRIC) IN ({safe})"
+def _order_sql(order: Optional[str]) -> str:
+    # Lista blanca: solo ASC/DESC llegan interpolados al SQL
+    return "ASC" if (order or "desc").lower() == "asc" else "DESC"
+
+
+def _limit_sql(top_k: Optional[int]) -> str:
+    return f"LIMIT {int(top_k)}" if top_k and int(top_k) > 0 else ""
+
+
+_AGG_SQL = {"mean": "AVG", "sum": "SUM", "median": "MEDIAN"}
 
 
 _ALLOWED_DIMS = {
@@ -95,20 +141,334 @@ def _safe_dim(group_by: Optional[List[str]], default: str = "zone_type") -> str:
 
 
 def _safe_group_cols(group_by: Optional[List[str]], fallback: List[str]) -> List[str]:
-    if not group_by:
-        return [c.upper() for c in fallback]
-    cols = []
-    for g in group_by:
-        key = (g or "").strip().lower()
-        cols.append(_ALLOWED_DIMS.get(key, key.upper()))
-    return cols
+    # Solo dimensiones conocidas: group_by puede venir del LLM y se interpola en el SQL
+    cols = [_ALLOWED_DIMS[k] for k in ((g or "").strip().lower() for g in (group_by or []))
+            if k in _ALLOWED_DIMS]
+    return cols or [c.upper() for c in fallback]
+
+
+class _Query(NamedTuple):
+    """Fragmentos SQL y parámetros compartidos por todos los handlers de tarea."""
+    where: str
+    params: List[Any]
+    lo: int
+    hi: int
+    filters_sql: str
+    filters_params: Tuple[str, ...]
+    order_sql: str
+    time_label: str
+    dbg: bool
+
+
+# -----------------------------
+# Handlers por tarea
+# -----------------------------
+def _build_filter_sql(windowed: bool, order_sql: str, has_limit: bool) -> str:
+    """Plantilla SQL de `filter` para una forma dada; solo `{where}` y los `?` varían por request."""
+    if windowed:
+        # promedio por zona en la ventana temporal
+        body = """
+        SELECT COUNTRY, CITY, ZONE, ZONE_TYPE, METRIC, AVG(VALUE) AS value
+        FROM zone_weekly_metrics
+        {where}
+        GROUP BY COUNTRY, CITY, ZONE, ZONE_TYPE, METRIC
+        ORDER BY value %s
+        %s
+        """
+    else:
+        body = """
+        SELECT COUNTRY, CITY, ZONE, ZONE_TYPE, METRIC, VALUE
+        FROM zone_weekly_metrics
+        {where}
+        ORDER BY VALUE %s
+        %s
+        """
+    return body % (order_sql, "LIMIT ?" if has_limit else "")
+
+
+# (windowed, order, has_limit) -> SQL
+_FILTER_SQL = {
+    (w, o, l): _build_filter_sql(w, o, l)
+    for w, o, l in product((False, True), ("ASC", "DESC"), (False, True))
+}
+
+
+def _run_filter(spec: AnalyticsSpec, con, q: _Query, out: Dict[str, Any]) -> Dict[str, Any]:
+    # Si el rango es L0W se lista la semana actual; si es una ventana, promediamos por zona en la ventana.
+    windowed = not (q.lo == q.hi == 0)
+    top_k = int(spec.ops.top_k) if spec.ops.top_k and int(spec.ops.top_k) > 0 else None
+    sql = _FILTER_SQL[(windowed, q.order_sql, top_k is not None)].format(where=q.where)
+    params = q.params + [top_k] if top_k is not None else q.params
+    if q.dbg:
+        out["debug_sql"] = sql
+    df = con.execute(sql, params).fetch_arrow_table()
+    if windowed:
+        out.update(
+            title=f"Top {spec.ops.top_k or ''} zonas — {spec.metrics[0]} ({q.time_label}, promedio ventana)",
+            data=df.to_pylist(),
+            suggestions=["¿Ver semana a semana?", "¿Cambiar a mediana?", "¿Exportar a CSV?"],
+        )
+    else:
+        out.update(
+            title=f"Top {spec.ops.top_k or ''} zonas — {spec.metrics[0]} ({q.time_label})",
+            data=df.to_pylist(),
+            suggestions=["¿Ver tendencia 8 semanas?", "¿Comparar con semana pasada?", "¿Exportar a CSV?"],
+        )
+    return out
+
+
+def _run_compare(spec: AnalyticsSpec, con, q: _Query, out: Dict[str, Any]) -> Dict[str, Any]:
+    # Compara por la primera dimensión indicada en group_by (fallback: ZONE_TYPE)
+    dim_col = _safe_dim(spec.group_by, default="zone_type")
+    sql = f"""
+    WITH base AS (
+      SELECT {dim_col} AS grp, VALUE
+      FROM zone_weekly_metrics
+      {q.where}
+    )
+    SELECT grp,
+           AVG(VALUE) AS value,
+           COUNT(*)    AS n_rows
+    FROM base
+    GROUP BY grp
+    ORDER BY value DESC
+    """
+    if q.dbg:
+        out["debug_sql"] = sql
+    df = con.execute(sql, q.params).fetch_arrow_table()
+    dim_name = spec.group_by[0] if (spec.group_by and len(spec.group_by) > 0) else "ZONE_TYPE"
+    out.update(
+        title=f"Comparación {spec.metrics[0]} por {dim_name.upper()} ({q.time_label})",
+        data=df.to_pylist(),
+        suggestions=["¿Desglosar por city?", "¿Ver distribución por segmento?"],
+    )
+    return out
+
+
+def _run_trend(spec: AnalyticsSpec, con, q: _Query, out: Dict[str, Any]) -> Dict[str, Any]:
+    # Serie temporal: agregamos por WEEK_OFFSET (y filtros ya aplicados)
+    sql = f"""
+    WITH base AS (
+      SELECT WEEK_OFFSET, VALUE
+      FROM zone_weekly_metrics
+      {q.where}
+    )
+    SELECT WEEK_OFFSET AS week, AVG(VALUE) AS value
+    FROM base
+    GROUP BY WEEK_OFFSET
+    ORDER BY week
+    """
+    if q.dbg:
+        out["debug_sql"] = sql
+    df = con.execute(sql, q.params).fetch_arrow_table()
+    out.update(
+        title=f"Evolución {spec.metrics[0]} ({q.time_label})",
+        data=df.to_pylist(),
+        suggestions=["¿Calcular pendiente y R²?", "¿Resaltar 3 caídas/altas consecutivas?"],
+    )
+    return out
+
+
+def _run_aggregate(spec: AnalyticsSpec, con, q: _Query, out: Dict[str, Any]) -> Dict[str, Any]:
+    group = _safe_group_cols(spec.group_by, fallback=["country"])
+    g = ", ".join(group)
+    agg = (spec.ops.agg or "mean").lower()
+    agg_sql = _AGG_SQL.get(agg)
+    if agg_sql is None:
+        # p.ej. "pct_change" es válido en el schema pero no es un agregado SQL: no lo disfrazamos de AVG
+        return {"error": f"Agregación no soportada para aggregate: {agg}"}
+    sql = f"""
+    WITH base AS (
+      SELECT {g}, VALUE
+      FROM zone_weekly_metrics
+      {q.where}
+    )
+    SELECT {g.replace(", ", ", ")} AS grp, {agg_sql}(VALUE) AS value
+    FROM base
+    GROUP BY {g}
+    ORDER BY value DESC
+    """
+    if q.dbg:
+        out["debug_sql"] = sql
+    df = con.execute(sql, q.params).fetch_arrow_table()
+    out.update(
+        title=f"{agg.capitalize()} de {spec.metrics[0]} por {', '.join(spec.group_by or ['country'])} ({q.time_label})",
+        data=df.to_pylist(),
+        suggestions=["¿Ver evolución por país 8 semanas?", "¿Top/bottom 5 países?"],
+    )
+    return out
+
+
+def _run_multivariable(spec: AnalyticsSpec, con, q: _Query, out: Dict[str, Any]) -> Dict[str, Any]:
+    # Alto LP (>= p70) y Bajo PO (<= p30) por país, usando promedio en ventana si lo>0
+    sql = f"""
+    WITH base AS (
+      SELECT COUNTRY, CITY, ZONE, METRIC, VALUE
+      FROM zone_weekly_metrics
+      {q.where} AND METRIC IN ('Lead Penetration','Perfect Orders')
+    ),
+    wide AS (
+      SELECT
+        COUNTRY, CITY, ZONE,
+        AVG(CASE WHEN METRIC='Lead Penetration' THEN VALUE END) AS LP,
+        AVG(CASE WHEN METRIC='Perfect Orders'      THEN VALUE END) AS PO
+      FROM base
+      GROUP BY COUNTRY, CITY, ZONE
+    ),
+    stats AS (
+      SELECT
+        COUNTRY,
+        quantile_cont(LP, 0.70) AS p70_lp,
+        quantile_cont(PO, 0.30) AS p30_po
+      FROM wide
+      GROUP BY COUNTRY
+    )
+    SELECT w.COUNTRY, w.CITY, w.ZONE, w.LP, w.PO
+    FROM wide w
+    JOIN stats s USING (COUNTRY)
+    WHERE w.LP IS NOT NULL AND w.PO IS NOT NULL
+      AND w.LP >= s.p70_lp AND w.PO <= s.p30_po
+    ORDER BY w.LP DESC, w.PO ASC
+    """
+    if q.dbg:
+        out["debug_sql"] = sql
+    df = con.execute(sql, q.params).fetch_arrow_table()
+    out.update(
+        title=f"Zonas con ALTO LP y BAJO PO ({q.time_label})",
+        data=df.to_pylist(),
+        suggestions=["¿Ver peer group?", "¿Tendencia 8 semanas?"],
+    )
+    return out
+
+
+def _run_inference(spec: AnalyticsSpec, con, q: _Query, out: Dict[str, Any]) -> Dict[str, Any]:
+    # Usa el rango pedido para la pendiente (slope) de ORDERS
+    lo_o, hi_o = _offset_bounds(spec.time.range or "L5W-L0W")
+    # Pendiente de ORDERS + correlaciones en el MISMO rango, en una sola consulta
+    sql = f"""
+    WITH base AS (
+      SELECT COUNTRY, CITY, ZONE, WEEK_OFFSET, ORDERS
+      FROM zone_weekly_orders
+      WHERE 1=1 {q.filters_sql}
+        AND WEEK_OFFSET BETWEEN ? AND ?
+    ),
+    stats AS (
+      SELECT COUNTRY, CITY, ZONE,
+             regr_slope(ORDERS, WEEK_OFFSET) AS slope
+      FROM base
+      GROUP BY COUNTRY, CITY, ZONE
+    ),
+    top_slope AS (
+      SELECT * FROM stats
+      ORDER BY slope DESC
+      {_limit_sql(spec.ops.top_k or 10)}
+    ),
+    wide AS (
+      SELECT m.COUNTRY, m.CITY, m.ZONE, m.WEEK_OFFSET,
+             MAX(CASE WHEN m.METRIC='Lead Penetration' THEN m.VALUE END) AS LP,
+             MAX(CASE WHEN m.METRIC='Perfect Orders'   THEN m.VALUE END) AS PO,
+             MAX(CASE WHEN m.METRIC='Gross Profit UE'  THEN m.VALUE END) AS GP
+      FROM zone_weekly_metrics m
+      JOIN top_slope t USING (COUNTRY, CITY, ZONE)
+      WHERE m.WEEK_OFFSET BETWEEN ? AND ?
+        AND m.VALUE IS NOT NULL
+        AND m.METRIC IN ('Lead Penetration','Perfect Orders','Gross Profit UE')
+      GROUP BY m.COUNTRY, m.CITY, m.ZONE, m.WEEK_OFFSET
+    ),
+    corrs AS (
+      SELECT COUNTRY, CITY, ZONE,
+             corr(LP, PO) AS corr_lp_po,
+             corr(LP, GP) AS corr_lp_gp,
+             corr(PO, GP) AS corr_po_gp
+      FROM wide
+      GROUP BY COUNTRY, CITY, ZONE
+    )
+    SELECT t.COUNTRY, t.CITY, t.ZONE, t.slope,
+           c.corr_lp_po, c.corr_lp_gp, c.corr_po_gp
+    FROM top_slope t
+    LEFT JOIN corrs c USING (COUNTRY, CITY, ZONE)
+    ORDER BY t.slope DESC
+    """
+    if q.dbg:
+        out["debug_sql"] = sql
+    df = con.execute(sql, [*q.filters_params, lo_o, hi_o, lo_o, hi_o]).fetch_arrow_table()
+
+    out.update(
+        title=f"Zonas que más crecen en Órdenes ({q.time_label}) + correlaciones",
+        data=df.to_pylist(),
+        suggestions=["¿Drivers por peer group?", "¿Playbook por zona?"],
+    )
+    return out
+
+
+def _run_contextual(spec: AnalyticsSpec, con, q: _Query, out: Dict[str, Any]) -> Dict[str, Any]:
+    # Caso intencionalmente WoW (semana actual vs anterior)
+    sql = f"""
+    WITH base AS (
+      -- una fila por (zona, métrica, semana): el source trae duplicados exactos y,
+      -- sin esto, el LAG de la semana 0 leería su propio duplicado en vez de la semana 1
+      SELECT COUNTRY, CITY, ZONE, METRIC, WEEK_OFFSET, any_value(VALUE) AS VALUE
+      FROM zone_weekly_metrics
+      WHERE 1=1 {q.filters_sql} AND METRIC IN ('Lead Penetration','Perfect Orders','Gross Profit UE')
+        AND VALUE IS NOT NULL
+        AND WEEK_OFFSET IN (0, 1)
+      GROUP BY ALL
+    ),
+    wow AS (
+      SELECT COUNTRY, CITY, ZONE, METRIC, WEEK_OFFSET, VALUE,
+             LAG(VALUE) OVER w AS prev_value
+      FROM base
+      WINDOW w AS (PARTITION BY COUNTRY, CITY, ZONE, METRIC ORDER BY WEEK_OFFSET DESC)
+    ),
+    joined AS (
+      SELECT COUNTRY, CITY, ZONE, METRIC, VALUE, prev_value,
+             CASE WHEN prev_value IS NULL OR prev_value=0 THEN NULL
+                  ELSE (VALUE - prev_value)/prev_value END AS pct_change
+      FROM wow
+      WHERE WEEK_OFFSET = 0
+    )
+    SELECT *
+    FROM joined
+    WHERE (METRIC='Perfect Orders' AND VALUE < 0.85)
+       OR (pct_change IS NOT NULL AND pct_change < -0.1)
+    ORDER BY METRIC, VALUE ASC
+    """
+    if q.dbg:
+        out["debug_sql"] = sql
+    df = con.execute(sql, list(q.filters_params)).fetch_arrow_table()
+    out.update(
+        title="Zonas problemáticas (PO bajo o caída >10% WoW)",
+        data=df.to_pylist(),
+        suggestions=["¿Priorizar por país/ciudad?", "¿Recomendaciones por tipo de problema?"],
+    )
+    return out
+
+
+def _unimpl(spec: AnalyticsSpec, con, q: _Query, out: Dict[str, Any]) -> Dict[str, Any]:
+    return {"error": f"Tarea no implementada: {spec.task}"}
+
+
+_HANDLERS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "filter": _run_filter,
+    "compare": _run_compare,
+    "trend": _run_trend,
+    "aggregate": _run_aggregate,
+    "multivariable": _run_multivariable,
+    "inference": _run_inference,
+    "contextual": _run_contextual,
+}
 
 
 # -----------------------------
 # Ejecutor principal
 # -----------------------------
 def execute(spec: AnalyticsSpec) -> Dict[str, Any]:
-    con = duckdb.connect(DUCK, read_only=True)
+    # Cursor prestado del pool del proceso: turnos concurrentes no se bloquean entre sí
+    with get_pool().acquire() as con:
+        return _execute(spec, con)
+
+
+def _execute(spec: AnalyticsSpec, con) -> Dict[str, Any]:
     out: Dict[str, Any] = {"visualization": spec.visualization, "suggestions": []}
 
     # Flag de debug (para exponer SQL)
@@ -122,301 +482,25 @@ def execute(spec: AnalyticsSpec) -> Dict[str, Any]:
 
     # WHERE base (filtros + métricas + tiempo + nulos fuera)
     lo, hi = _offset_bounds(spec.time.range)
+    filters_sql, filters_params = _filters_where(_filters_key(spec.filters))
+    metric_sql, metric_params = _metric_where(metrics_for_where)
     where = (
         "WHERE 1=1 "
-        + _filters_where(spec.filters.model_dump())
+        + filters_sql
         + " "
-        + _metric_where(metrics_for_where)
+        + metric_sql
         + " AND VALUE IS NOT NULL"
-        + f" AND WEEK_OFFSET BETWEEN {lo} AND {hi}"
+        + " AND WEEK_OFFSET BETWEEN ? AND ?"
     )
-
-    # Label de tiempo legible
-    time_label = _pretty_range(spec.time.range)
-
-    # ---------------- filter ----------------
-    if spec.task == "filter":
-        # Si el rango es L0W se lista la semana actual; si es una ventana, promediamos por zona en la ventana.
-        if lo == hi == 0:
-            sql = f"""
-            SELECT COUNTRY, CITY, ZONE, ZONE_TYPE, METRIC, VALUE
-            FROM zone_weekly_metrics
-            {where}
-            ORDER BY VALUE {"DESC" if (spec.ops.order or 'desc').lower() != "asc" else "ASC"}
-            {f"LIMIT {spec.ops.top_k}" if spec.ops.top_k else ""}
-            """
-            if dbg:
-                out["debug_sql"] = sql
-            df = con.execute(sql).pl()
-            out.update(
-                title=f"Top {spec.ops.top_k or ''} zonas — {spec.metrics[0]} ({time_label})",
-                data=df.to_dicts(),
-                suggestions=["¿Ver tendencia 8 semanas?", "¿Comparar con semana pasada?", "¿Exportar a CSV?"],
-            )
-        else:
-            # promedio por zona en la ventana temporal
-            sql = f"""
-            WITH base AS (
-              SELECT COUNTRY, CITY, ZONE, ZONE_TYPE, METRIC, VALUE
-              FROM zone_weekly_metrics
-              {where}
-            ),
-            agg AS (
-              SELECT COUNTRY, CITY, ZONE, ZONE_TYPE, METRIC,
-                     AVG(VALUE) AS value
-              FROM base
-              GROUP BY COUNTRY, CITY, ZONE, ZONE_TYPE, METRIC
-            )
-            SELECT COUNTRY, CITY, ZONE, ZONE_TYPE, METRIC, value
-            FROM agg
-            ORDER BY value {"DESC" if (spec.ops.order or 'desc').lower() != "asc" else "ASC"}
-            {f"LIMIT {spec.ops.top_k}" if spec.ops.top_k else ""}
-            """
-            if dbg:
-                out["debug_sql"] = sql
-            df = con.execute(sql).pl()
-            out.update(
-                title=f"Top {spec.ops.top_k or ''} zonas — {spec.metrics[0]} ({time_label}, promedio ventana)",
-                data=df.to_dicts(),
-                suggestions=["¿Ver semana a semana?", "¿Cambiar a mediana?", "¿Exportar a CSV?"],
-            )
-        con.close()
-        return out
-
-    # ---------------- compare ----------------
-    if spec.task == "compare":
-        # Compara por la primera dimensión indicada en group_by (fallback: ZONE_TYPE)
-        dim_col = _safe_dim(spec.group_by, default="zone_type")
-        sql = f"""
-        WITH base AS (
-          SELECT {dim_col} AS grp, VALUE
-          FROM zone_weekly_metrics
-          {where}
-        )
-        SELECT grp,
-               AVG(VALUE) AS value,
-               COUNT(*)    AS n_rows
-        FROM base
-        GROUP BY grp
-        ORDER BY value DESC
-        """
-        if dbg:
-            out["debug_sql"] = sql
-        df = con.execute(sql).pl()
-        dim_name = spec.group_by[0] if (spec.group_by and len(spec.group_by) > 0) else "ZONE_TYPE"
-        out.update(
-            title=f"Comparación {spec.metrics[0]} por {dim_name.upper()} ({time_label})",
-            data=df.to_dicts(),
-            suggestions=["¿Desglosar por city?", "¿Ver distribución por segmento?"],
-        )
-        con.close()
-        return out
-
-    # ---------------- trend ----------------
-    if spec.task == "trend":
-        # Serie temporal: agregamos por WEEK_OFFSET (y filtros ya aplicados)
-        sql = f"""
-        WITH base AS (
-          SELECT WEEK_OFFSET, VALUE
-          FROM zone_weekly_metrics
-          {where}
-        )
-        SELECT WEEK_OFFSET AS week, AVG(VALUE) AS value
-        FROM base
-        GROUP BY WEEK_OFFSET
-        ORDER BY week
-        """
-        if dbg:
-            out["debug_sql"] = sql
-        df = con.execute(sql).pl()
-        out.update(
-            title=f"Evolución {spec.metrics[0]} ({time_label})",
-            data=df.to_dicts(),
-            suggestions=["¿Calcular pendiente y R²?", "¿Resaltar 3 caídas/altas consecutivas?"],
-        )
-        con.close()
-        return out
-
-    # ---------------- aggregate ----------------
-    if spec.task == "aggregate":
-        group = _safe_group_cols(spec.group_by, fallback=["country"])
-        g = ", ".join(group)
-        agg = (spec.ops.agg or "mean").lower()
-        agg_sql = "AVG" if agg == "mean" else agg.upper()
-        sql = f"""
-        WITH base AS (
-          SELECT {g}, VALUE
-          FROM zone_weekly_metrics
-          {where}
-        )
-        SELECT {g.replace(", ", ", ")} AS grp, {agg_sql}(VALUE) AS value
-        FROM base
-        GROUP BY {g}
-        ORDER BY value DESC
-        """
-        if dbg:
-            out["debug_sql"] = sql
-        df = con.execute(sql).pl()
-        out.update(
-            title=f"{agg.capitalize()} de {spec.metrics[0]} por {', '.join(spec.group_by or ['country'])} ({time_label})",
-            data=df.to_dicts(),
-            suggestions=["¿Ver evolución por país 8 semanas?", "¿Top/bottom 5 países?"],
-        )
-        con.close()
-        return out
-
-    # ---------------- multivariable ----------------
-    if spec.task == "multivariable":
-        # Alto LP (>= p70) y Bajo PO (<= p30) por país, usando promedio en ventana si lo>0
-        sql = f"""
-        WITH base AS (
-          SELECT COUNTRY, CITY, ZONE, WEEK_OFFSET, METRIC, VALUE
-          FROM zone_weekly_metrics
-          {where} AND METRIC IN ('Lead Penetration','Perfect Orders')
-        ),
-        wide AS (
-          SELECT
-            COUNTRY, CITY, ZONE,
-            AVG(CASE WHEN METRIC='Lead Penetration' THEN VALUE END) AS LP,
-            AVG(CASE WHEN METRIC='Perfect Orders'      THEN VALUE END) AS PO
-          FROM base
-          GROUP BY COUNTRY, CITY, ZONE
-        ),
-        stats AS (
-          SELECT
-            COUNTRY,
-            quantile_cont(LP, 0.70) OVER (PARTITION BY COUNTRY) AS p70_lp,
-            quantile_cont(PO, 0.30) OVER (PARTITION BY COUNTRY) AS p30_po,
-            COUNTRY AS c
-          FROM wide
-        )
-        SELECT w.COUNTRY, w.CITY, w.ZONE, w.LP, w.PO
-        FROM wide w
-        JOIN stats s ON w.COUNTRY = s.c
-        WHERE w.LP IS NOT NULL AND w.PO IS NOT NULL
-          AND w.LP >= s.p70_lp AND w.PO <= s.p30_po
-        ORDER BY w.LP DESC, w.PO ASC
-        """
-        if dbg:
-            out["debug_sql"] = sql
-        df = con.execute(sql).pl()
-        out.update(
-            title=f"Zonas con ALTO LP y BAJO PO ({time_label})",
-            data=df.to_dicts(),
-            suggestions=["¿Ver peer group?", "¿Tendencia 8 semanas?"],
-        )
-        con.close()
-        return out
-
-    # ---------------- inference ----------------
-    if spec.task == "inference":
-        # Usa el rango pedido para la pendiente (slope) de ORDERS
-        lo_o, hi_o = _offset_bounds(spec.time.range or "L5W-L0W")
-        sql_slope = f"""
-        WITH base AS (
-          SELECT COUNTRY, CITY, ZONE, WEEK_OFFSET, ORDERS
-          FROM zone_weekly_orders
-          WHERE 1=1 {_filters_where(spec.filters.model_dump())}
-            AND WEEK_OFFSET BETWEEN {lo_o} AND {hi_o}
-        ),
-        with_x AS (
-          SELECT COUNTRY, CITY, ZONE, WEEK_OFFSET, ORDERS,
-                 ROW_NUMBER() OVER (PARTITION BY COUNTRY, CITY, ZONE ORDER BY WEEK_OFFSET) - 1 AS x
-          FROM base
-        ),
-        stats AS (
-          SELECT COUNTRY, CITY, ZONE,
-                 covar_samp(ORDERS, x) / NULLIF(var_samp(x), 0) AS slope
-          FROM with_x
-          GROUP BY COUNTRY, CITY, ZONE
-        )
-        SELECT * FROM stats
-        ORDER BY slope DESC
-        LIMIT {spec.ops.top_k or 10}
-        """
-        if dbg:
-            out["debug_sql"] = sql_slope
-        top_df = con.execute(sql_slope).pl()
-
-        # Correlaciones con métricas operativas en el MISMO rango
-        out_rows = []
-        for r in top_df.iter_rows(named=True):
-            country, city, zone = r["COUNTRY"], r["CITY"], r["ZONE"]
-            corr_sql = f"""
-            WITH m AS (
-              SELECT WEEK_OFFSET, METRIC, VALUE
-              FROM zone_weekly_metrics
-              WHERE UPPER(COUNTRY)=UPPER('{country}')
-                AND UPPER(CITY)=UPPER('{city}')
-                AND UPPER(ZONE)=UPPER('{zone}')
-                AND WEEK_OFFSET BETWEEN {lo_o} AND {hi_o}
-                AND VALUE IS NOT NULL
-                AND METRIC IN ('Lead Penetration','Perfect Orders','Gross Profit UE')
-            ),
-            wide AS (
-              SELECT WEEK_OFFSET,
-                     MAX(CASE WHEN METRIC='Lead Penetration' THEN VALUE END) AS LP,
-                     MAX(CASE WHEN METRIC='Perfect Orders'   THEN VALUE END) AS PO,
-                     MAX(CASE WHEN METRIC='Gross Profit UE'  THEN VALUE END) AS GP
-              FROM m GROUP BY WEEK_OFFSET
-            )
-            SELECT
-              corr(LP, PO) AS corr_lp_po,
-              corr(LP, GP) AS corr_lp_gp,
-              corr(PO, GP) AS corr_po_gp
-            FROM wide
-            """
-            corr = con.execute(corr_sql).pl().to_dicts()[0]
-            out_rows.append({**r, **corr})
-
-        out.update(
-            title=f"Zonas que más crecen en Órdenes ({time_label}) + correlaciones",
-            data=out_rows,
-            suggestions=["¿Drivers por peer group?", "¿Playbook por zona?"],
-        )
-        con.close()
-        return out
-
-    # ---------------- contextual ----------------
-    if spec.task == "contextual":
-        # Caso intencionalmente WoW (semana actual vs anterior)
-        sql = f"""
-        WITH cur AS (
-          SELECT COUNTRY, CITY, ZONE, METRIC, VALUE
-          FROM zone_weekly_metrics
-          { _filters_where(spec.filters.model_dump()) } AND METRIC IN ('Lead Penetration','Perfect Orders','Gross Profit UE')
-            AND VALUE IS NOT NULL
-            AND WEEK_OFFSET = 0
-        ),
-        prev AS (
-          SELECT COUNTRY, CITY, ZONE, METRIC, VALUE AS prev_value
-          FROM zone_weekly_metrics
-          { _filters_where(spec.filters.model_dump()) } AND METRIC IN ('Lead Penetration','Perfect Orders','Gross Profit UE')
-            AND VALUE IS NOT NULL
-            AND WEEK_OFFSET = 1
-        ),
-        joined AS (
-          SELECT c.COUNTRY, c.CITY, c.ZONE, c.METRIC, c.VALUE, p.prev_value,
-                 CASE WHEN p.prev_value IS NULL OR p.prev_value=0 THEN NULL
-                      ELSE (c.VALUE - p.prev_value)/p.prev_value END AS pct_change
-          FROM cur c LEFT JOIN prev p USING (COUNTRY, CITY, ZONE, METRIC)
-        )
-        SELECT *
-        FROM joined
-        WHERE (METRIC='Perfect Orders' AND VALUE < 0.85)
-           OR (pct_change IS NOT NULL AND pct_change < -0.1)
-        ORDER BY METRIC, VALUE ASC
-        """
-        if dbg:
-            out["debug_sql"] = sql
-        df = con.execute(sql).pl()
-        out.update(
-            title="Zonas problemáticas (PO bajo o caída >10% WoW)",
-            data=df.to_dicts(),
-            suggestions=["¿Priorizar por país/ciudad?", "¿Recomendaciones por tipo de problema?"],
-        )
-        con.close()
-        return out
-
-    con.close()
-    return {"error": f"Tarea no implementada: {spec.task}"}
+    q = _Query(
+        where=where,
+        params=[*filters_params, *metric_params, lo, hi],
+        lo=lo,
+        hi=hi,
+        filters_sql=filters_sql,
+        filters_params=filters_params,
+        order_sql=_order_sql(spec.ops.order),
+        time_label=_pretty_range(spec.time.range),  # Label de tiempo legible
+        dbg=dbg,
+    )
+    return _HANDLERS.get(spec.task, _unimpl)(spec, con, q, out)
@@ -17,6 +17,9 @@ class Memory:
       - Limpiar siempre `country` cuando la consulta agrupa por país
         (group_by contiene 'country'), para evitar el efecto de "país pegado".
       - city, zone y zone_type se persisten si llegan en el spec.
+
+    El estado vive solo en memoria del proceso (una instancia por sesión en la API):
+    `update_from_spec` nunca serializa ni escribe a disco en el camino del request.
     """
 
     def __init__(self) -> None:
@@ -36,16 +39,16 @@ class Memory:
         group_by = getattr(spec, "group_by", None) or []
         context = getattr(spec, "context", {}) or {}
 
-        # Normaliza group_by para comparaciones robustas
-        group_by_norm = [
-            (g.lower() if isinstance(g, str) else g) for g in group_by
-        ]
+        # ¿Agrupa por país? (comparación robusta a mayúsculas, corta en el primer match)
+        groups_by_country = any(
+            isinstance(g, str) and g.lower() == "country" for g in group_by
+        )
 
         # --------- COUNTRY (reglas de higiene) ---------
         explicit_country = bool(context.get("explicit_country", False))
         incoming_country = getattr(filters, "country", None) if filters else None
 
-        if "country" in group_by_norm:
+        if groups_by_country:
             # Si agrupas por país, NUNCA arrastres filtro de país.
             self.state["country"] = None
         else:
@@ -1,17 +1,32 @@
 # src/bot/metrics.py
 from __future__ import annotations
+from functools import lru_cache
 from typing import Dict, Tuple, Optional
 from pathlib import Path
+import warnings
 import yaml
-import re
 
-CATALOG_PATH = Path("catalog/metrics.yaml")
+from .text_utils import normalize
+
+try:
+    import ahocorasick  # type: ignore  # pyahocorasick (opcional)
+except Exception:  # pragma: no cover - si no está instalado se usa el scan lineal
+    ahocorasick = None
 
-def _normalize(s: str) -> str:
-    s = s.lower()
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+# libyaml (C) si está disponible; el SafeLoader puro-Python es mucho más lento
+try:
+    from yaml import CSafeLoader as _Loader
+except ImportError:  # pragma: no cover - PyYAML sin extensión C
+    from yaml import SafeLoader as _Loader
+    warnings.warn(
+        "PyYAML sin libyaml: el catálogo se parsea con SafeLoader puro-Python "
+        "(reinstala pyyaml con la extensión C para acelerar el arranque).",
+        RuntimeWarning,
+    )
+
+CATALOG_PATH = Path("catalog/metrics.yaml")
 
+@lru_cache(maxsize=8)
 def load_metric_catalog(path: Path = CATALOG_PATH) -> Dict:
     if not path.exists():
         # Fallback mínimo si el YAML no está (no rompe el bot)
@@ -22,46 +37,75 @@ def load_metric_catalog(path: Path = CATALOG_PATH) -> Dict:
                            "value_type": "count", "agg_default": "sum", "higher_is_better": True, "range_hint": None}
             }
         }
-    data = yaml.safe_load(path.read_text(encoding="utf-8"))
+    # bytes: libyaml decodifica UTF-8 en C
+    data = yaml.load(path.read_bytes(), Loader=_Loader)
     return data or {}
 
 CAT = load_metric_catalog()
 
 # Índices rápidos
+_PROPS_BY_DATA: Dict[str, Dict] = { m["data_name"]: m for m in CAT.get("metrics", {}).values() }
 _LABEL_BY_DATA = { m["data_name"]: m.get("label", m["data_name"])
                    for m in CAT.get("metrics", {}).values() }
 _DATA_BY_LABEL = { m.get("label", k): m["data_name"]
                    for k, m in CAT.get("metrics", {}).items() }
 
-# mapa de sinónimos → data_name
-_SYNONYM_INDEX: Dict[str, str] = {}
-for key, meta in CAT.get("metrics", {}).items():
-    data_name = meta["data_name"]
-    # añade el label y el data_name como sinónimos
-    for w in set([meta.get("label", ""), data_name] + meta.get("synonyms", [])):
-        if not w: 
-            continue
-        _S = _normalize(w)
-        _SYNONYM_INDEX[_S] = data_name
+# mapa de sinónimos → data_name (label y data_name cuentan como sinónimos).
+# Si un sinónimo se repite entre métricas gana la última del catálogo; el índice
+# queda ordenado del más largo al más corto.
+_SYNONYM_PAIRS = (
+    (normalize(w), m["data_name"])
+    for m in CAT.get("metrics", {}).values()
+    for w in (m.get("label"), m["data_name"], *m.get("synonyms", []))
+    if w
+)
+_SYNONYM_INDEX: Dict[str, str] = dict(
+    sorted(dict(_SYNONYM_PAIRS).items(), key=lambda kv: -len(kv[0]))
+)
+
+# Autómata Aho–Corasick sobre los sinónimos: una sola pasada por la pregunta.
+# Payload (largo, orden en el índice, data_name) para elegir el match más largo.
+_SYN_AUTOMATON = None
+if ahocorasick is not None and _SYNONYM_INDEX:
+    _SYN_AUTOMATON = ahocorasick.Automaton()
+    for _i, (_syn, _dn) in enumerate(_SYNONYM_INDEX.items()):
+        if _syn:
+            _SYN_AUTOMATON.add_word(_syn, (len(_syn), _i, _dn))
+    _SYN_AUTOMATON.make_automaton()
+
+
+def _longest_synonym(q: str) -> Optional[str]:
+    """data_name del sinónimo más largo contenido en `q` ("perfect orders" gana a "orders")."""
+    best = None
+    if _SYN_AUTOMATON is not None:
+        for _, hit in _SYN_AUTOMATON.iter(q):
+            if best is None or (hit[0], -hit[1]) > (best[0], -best[1]):
+                best = hit
+        return best[2] if best else None
+    # fallback: scan lineal por substring
+    for i, (syn, data_name) in enumerate(_SYNONYM_INDEX.items()):
+        if syn and syn in q and (best is None or len(syn) > best[0]):
+            best = (len(syn), i, data_name)
+    return best[2] if best else None
+
 
 def match_metric_from_catalog(utterance: str) -> Optional[Tuple[str, Dict]]:
     """
     Devuelve (data_name, props) si encuentra una métrica por label, data_name o sinónimos.
+    Ante varios sinónimos contenidos en la pregunta gana el más largo.
     """
-    q = _normalize(utterance)
+    q = normalize(utterance)
     # match por substring (tolerante)
-    for syn, data_name in _SYNONYM_INDEX.items():
-        if syn and syn in q:
-            # devuelve las props completas del catálogo
-            for meta in CAT.get("metrics", {}).values():
-                if meta["data_name"] == data_name:
-                    return data_name, meta
+    data_name = _longest_synonym(q)
+    if data_name in _PROPS_BY_DATA:
+        # devuelve las props completas del catálogo
+        return data_name, _PROPS_BY_DATA[data_name]
     return None
 
 def props_for_metric(data_name: str) -> Dict:
-    for meta in CAT.get("metrics", {}).values():
-        if meta["data_name"] == data_name:
-            return meta
+    meta = _PROPS_BY_DATA.get(data_name)
+    if meta is not None:
+        return meta
     # fallback neutro
     return {"data_name": data_name, "value_type": "ratio", "agg_default": "mean", "higher_is_better": True, "range_hint": [0,1]}
 
@@ -2,19 +2,20 @@
 from __future__ import annotations
 
 import os
+import pickle
 import re
-import unicodedata
 from functools import lru_cache
 from pathlib import Path
 from typing import Optional, List, Dict, Tuple
 
 from .schema import AnalyticsSpec, Filters, Ops, TimeSpec
+from .text_utils import normalize
 from .metrics import match_metric_from_catalog, props_for_metric, label_for_metric
 
 try:
-    import duckdb  # type: ignore
-except Exception:  # pragma: no cover - si duckdb no está instalado aún
-    duckdb = None
+    import ahocorasick  # type: ignore  # pyahocorasick (opcional)
+except Exception:  # pragma: no cover - sin autómata se usa el scan lineal
+    ahocorasick = None
 
 # ---------------------------------------------------------------------
 # Diccionario de métricas (canónicas) y sus sinónimos (fallback legado)
@@ -47,6 +48,21 @@ METRIC_SYNONYMS: Dict[str, List[str]] = {
     ],
 }
 
+# sinónimo normalizado → canónica (la canónica en minúsculas cuenta como sinónimo)
+_SYN_TO_CANONICAL: Dict[str, str] = {}
+for _canonical, _syns in METRIC_SYNONYMS.items():
+    for _syn in (_canonical.lower(), *_syns):
+        _SYN_TO_CANONICAL.setdefault(normalize(_syn), _canonical)
+_SYNS_SORTED: List[str] = sorted(_SYN_TO_CANONICAL, key=len, reverse=True)
+
+# Autómata sobre los mismos sinónimos; payload = posición en _SYNS_SORTED (menor = más largo)
+_SYN_AUTOMATON = None
+if ahocorasick is not None:
+    _SYN_AUTOMATON = ahocorasick.Automaton()
+    for _rank, _syn in enumerate(_SYNS_SORTED):
+        _SYN_AUTOMATON.add_word(_syn, _rank)
+    _SYN_AUTOMATON.make_automaton()
+
 METRIC_ALIASES_TO_DATA: Dict[str, str] = {
     "Lead Penetration": "Lead Penetration",
     "Perfect Orders": "Perfect Orders",
@@ -65,38 +81,82 @@ SPANISH_NUMBER_WORDS: Dict[str, int] = {
 }
 NUMBER_WORD_PATTERN = "|".join(sorted(SPANISH_NUMBER_WORDS.keys(), key=len, reverse=True))
 
-def _strip_accents(text: str) -> str:
-    return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+# Regex precompiladas (to_spec las evalúa en cada pregunta)
+_RE_TOP_BOTTOM_NUM = re.compile(r"\b(top|bottom)\s+(\d+)\b")
+_RE_TOP_BOTTOM_WORD = re.compile(r"\b(top|bottom)\s+([a-z]+)\b")
+_RE_LAS_N_MEJORES = re.compile(r"\b(las|los)\s+(\d+)\s+(mejores|peores|mayores|menores)\b")
+_RE_TOPK_NUM = re.compile(r"\b(top|bottom|mejores?|peores?)\s+(\d+)\b")
+_RE_N_ZONAS = re.compile(r"\b(\d+)\s+zonas?\b")
+_RE_TOPK_WORD = re.compile(rf"\b(top|bottom|mejores?|peores?)\s+({NUMBER_WORD_PATTERN})\b")
+_RE_LAST_N = re.compile(r"(ultim[oa]s?|últim[oa]s?)\s+(\d+)\s+semanas?")
+_RE_LAST_N_WORD = re.compile(rf"(ultim[oa]s?|últim[oa]s?)\s+({NUMBER_WORD_PATTERN})\s+semanas?")
+
+def _alternation(words) -> re.Pattern:
+    # Substring (sin \b), igual que los `w in qn` que reemplaza; más largas primero
+    return re.compile("|".join(re.escape(w) for w in sorted(words, key=len, reverse=True)))
+
+_COUNTRIES_BY_NAME: Dict[str, str] = {
+    "colombia": "Colombia",
+    "mexico": "Mexico",
+    "peru": "Peru",
+    "chile": "Chile",
+    "argentina": "Argentina",
+    "brasil": "Brasil",
+    "uruguay": "Uruguay",
+    "ecuador": "Ecuador",
+}
+_COUNTRY_PRIORITY = {k: i for i, k in enumerate(_COUNTRIES_BY_NAME)}
+_RE_COUNTRY = _alternation(_COUNTRIES_BY_NAME)
+_RE_WEALTHY = _alternation(["wealthy", "rica", "altas rentas"])
+_RE_NON_WEALTHY = _alternation(["non wealthy", "non-wealthy", "no rica", "popular"])
+_RE_SEGMENT = _alternation(["wealthy", "non wealthy", "non-wealthy", "rica", "no rica", "popular"])
+_RE_THIS_WEEK = _alternation(["esta semana", "semana actual"])
+
+# Disparadores por tarea. El lookahead hace que finditer pruebe cada posición
+# (matches solapados), así ninguna palabra clave tapa a otra como con `w in qn`.
+_TASK_TRIGGERS: Dict[str, List[str]] = {
+    "compare": ["compara", "comparar", "diferencia entre"],
+    "trend": ["evolucion", "tendencia", "trend"],
+    "aggregate": ["promedio", "media", "suma", "total"],
+    "inference": ["crecen", "crecimiento", "aumentan", "suben"],
+    "contextual": ["zonas problem", "problematic"],
+}
+_RE_TASK = re.compile(
+    "(?=" + "|".join(f"(?P<{task}>{_alternation(words).pattern})"
+                     for task, words in _TASK_TRIGGERS.items()) + ")"
+)
 
-def normalize(text: str) -> str:
-    text = _strip_accents(text.lower())
-    return re.sub(r"\s+", " ", text).strip()
 
 _DESC_TRIGGERS = {"mayor", "maximo", "mas alto", "top", "superior", "mejor", "highest", "max"}
 _ASC_TRIGGERS  = {"menor", "minimo", "mas bajo", "peor", "peores", "lowest", "min", "inferior", "bottom"}
 _MONTHS = {"enero","febrero","marzo","abril","mayo","junio","julio","agosto","septiembre","octubre","noviembre","diciembre"}
+# "mayo" como palabra delimitada por espacios/extremos (equivale a " mayo " in f" {t} " sobre texto normalizado)
+_RE_MAYO = re.compile(r"(?<!\S)mayo(?!\S)")
+_RE_MONTHS = re.compile("|".join(sorted(_MONTHS)))
 
-def _is_month_ctx(q: str) -> bool:
-    t = normalize(q)
-    return (" mayo " in f" {t} ") and any(m in t for m in _MONTHS)
+def _is_month_ctx(t: str) -> bool:
+    # `t` ya normalizado
+    return _RE_MAYO.search(t) is not None and _RE_MONTHS.search(t) is not None
 
 def decide_order_and_n(q: str) -> Tuple[str, Optional[int]]:
-    qn = normalize(q)
-    m = re.search(r"\b(top|bottom)\s+(\d+)\b", qn)
+    return _decide_order_and_n(normalize(q))
+
+def _decide_order_and_n(qn: str) -> Tuple[str, Optional[int]]:
+    m = _RE_TOP_BOTTOM_NUM.search(qn)
     if m:
         order = "desc" if m.group(1) == "top" else "asc"
         return order, int(m.group(2))
-    m = re.search(r"\b(top|bottom)\s+([a-z]+)\b", qn)
+    m = _RE_TOP_BOTTOM_WORD.search(qn)
     if m and m.group(2) in SPANISH_NUMBER_WORDS:
         order = "desc" if m.group(1) == "top" else "asc"
         return order, SPANISH_NUMBER_WORDS[m.group(2)]
-    m = re.search(r"\b(las|los)\s+(\d+)\s+(mejores|peores|mayores|menores)\b", qn)
+    m = _RE_LAS_N_MEJORES.search(qn)
     if m:
         order = "desc" if ("mejor" in m.group(3) or "mayor" in m.group(3)) else "asc"
         return order, int(m.group(2))
     desc = any(w in qn for w in _DESC_TRIGGERS)
     asc  = any(w in qn for w in _ASC_TRIGGERS)
-    if not _is_month_ctx(q) and " mayo " in f" {qn} ":
+    if not _is_month_ctx(qn) and _RE_MAYO.search(qn):
         desc = True
     if asc and desc:
         if any(w in qn for w in ["peor","peores","menor","menores","mas bajo","bottom"]):
@@ -106,6 +166,8 @@ def decide_order_and_n(q: str) -> Tuple[str, Optional[int]]:
     if asc:  return "asc", None
     return "desc", None
 
+GEO_CACHE_FILE = "geo_index.pkl"
+
 @lru_cache(maxsize=1)
 def _load_geo_catalog() -> Tuple[Dict[str, Tuple[str, Optional[str], Optional[str]]],
                                  Dict[str, Tuple[str, Optional[str]]],
@@ -114,30 +176,41 @@ def _load_geo_catalog() -> Tuple[Dict[str, Tuple[str, Optional[str], Optional[st
     city_index: Dict[str, Tuple[str, Optional[str]]] = {}
     country_index: Dict[str, str] = {}
 
-    if duckdb is None:
-        return zone_index, city_index, country_index
-
     db_path = Path("data/processed/warehouse.duckdb")
     if not db_path.exists():
         return zone_index, city_index, country_index
 
+    # Caché en disco junto al warehouse, válida mientras no cambie su mtime
+    cache_path = db_path.with_name(GEO_CACHE_FILE)
+    db_mtime = db_path.stat().st_mtime_ns
+    try:
+        stamp, cached = pickle.loads(cache_path.read_bytes())
+        if stamp == db_mtime:
+            return cached
+    except Exception:
+        pass
+
+    # Import diferido: duckdb solo se carga si hay que reconstruir el índice
+    try:
+        import duckdb  # type: ignore
+    except Exception:  # pragma: no cover - si duckdb no está instalado aún
+        return zone_index, city_index, country_index
+
     try:
         con = duckdb.connect(str(db_path), read_only=True)
     except Exception:
         return zone_index, city_index, country_index
 
     try:
-        df = con.execute("SELECT DISTINCT COUNTRY, CITY, ZONE FROM zone_weekly_metrics").df()
+        # Tuplas nativas: sin DataFrame intermedio ni iterrows
+        rows = con.execute("SELECT DISTINCT COUNTRY, CITY, ZONE FROM zone_weekly_metrics").fetchall()
     except Exception:
         con.close()
         return zone_index, city_index, country_index
 
     con.close()
 
-    for _, row in df.iterrows():
-        country = row.get("COUNTRY")
-        city = row.get("CITY")
-        zone = row.get("ZONE")
+    for country, city, zone in rows:
         if isinstance(zone, str) and zone.strip():
             zone_index[normalize(zone)] = (zone, city if isinstance(city, str) else None,
                                            country if isinstance(country, str) else None)
@@ -150,60 +223,109 @@ def _load_geo_catalog() -> Tuple[Dict[str, Tuple[str, Optional[str], Optional[st
     city_index.setdefault("mexico city", ("Ciudad de Mexico", "Mexico"))
     city_index.setdefault("bogota", ("Bogota", "Colombia"))
     zone_index.setdefault("chapinero", ("Chapinero", "Bogota", "Colombia"))
+
+    try:
+        cache_path.write_bytes(pickle.dumps((db_mtime, (zone_index, city_index, country_index)),
+                                            protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        pass  # sin permisos de escritura: se reconstruye en el próximo arranque
     return zone_index, city_index, country_index
 
+@lru_cache(maxsize=1)
+def _geo_automaton():
+    """
+    Autómata Aho–Corasick sobre zonas + ciudades + países normalizados
+    (payload: largo del nombre y {tipo: valores}). None si no hay pyahocorasick o catálogo.
+    """
+    if ahocorasick is None:
+        return None
+    zones, cities, countries = _load_geo_catalog()
+    entries: Dict[str, Dict[str, object]] = {}
+    for kind, index in (("zone", zones), ("city", cities), ("country", countries)):
+        for key, vals in index.items():
+            if key:
+                entries.setdefault(key, {})[kind] = vals
+    if not entries:
+        return None
+    A = ahocorasick.Automaton()
+    for key, kinds in entries.items():
+        A.add_word(key, (len(key), kinds))
+    A.make_automaton()
+    return A
+
+def _geo_longest(qn: str, kind: str):
+    """Valores del nombre más largo de tipo `kind` contenido en `qn` (una pasada del autómata)."""
+    best_len, best = 0, None
+    for _, (n, kinds) in _geo_automaton().iter(qn):
+        if kind in kinds and n > best_len:
+            best_len, best = n, kinds[kind]
+    return best
+
 def match_metric(q: str) -> Optional[str]:
-    qn = normalize(q)
-    for canonical in METRIC_SYNONYMS.keys():
-        if canonical.lower() in qn:
-            return canonical
-    for canonical, syns in METRIC_SYNONYMS.items():
-        for s in syns:
-            if s in qn:
-                return canonical
+    return _match_metric(normalize(q))
+
+def _match_metric(qn: str) -> Optional[str]:
+    # Más largo primero: "perfect orders" gana a "orders"
+    if _SYN_AUTOMATON is not None:
+        rank = min((r for _, r in _SYN_AUTOMATON.iter(qn)), default=None)
+        return _SYN_TO_CANONICAL[_SYNS_SORTED[rank]] if rank is not None else None
+    for syn in _SYNS_SORTED:
+        if syn in qn:
+            return _SYN_TO_CANONICAL[syn]
     return None
 
 def normalize_canonical_metric_for_data(canonical: str) -> str:
     return METRIC_ALIASES_TO_DATA.get(canonical, canonical)
 
 def extract_country(q: str) -> Optional[str]:
-    qn = normalize(q)
-    _, _, country_index = _load_geo_catalog()
-    for norm_name, country in country_index.items():
-        if norm_name and norm_name in qn:
+    return _extract_country(normalize(q))
+
+def _extract_country(qn: str) -> Optional[str]:
+    if _geo_automaton() is not None:
+        country = _geo_longest(qn, "country")
+        if country:
             return country
-    countries_by_name = {
-        "colombia": "Colombia",
-        "mexico": "Mexico",
-        "peru": "Peru",
-        "chile": "Chile",
-        "argentina": "Argentina",
-        "brasil": "Brasil",
-        "uruguay": "Uruguay",
-        "ecuador": "Ecuador",
-    }
-    for k, name in countries_by_name.items():
-        if k in qn:
-            return name
+    else:
+        _, _, country_index = _load_geo_catalog()
+        for norm_name, country in country_index.items():
+            if norm_name and norm_name in qn:
+                return country
+    # Fallback estático: una sola pasada del regex; ante varios países gana el de
+    # mayor prioridad en _COUNTRIES_BY_NAME (mismo criterio que el scan anterior).
+    hits = {m.group(0) for m in _RE_COUNTRY.finditer(qn)}
+    if hits:
+        return _COUNTRIES_BY_NAME[min(hits, key=_COUNTRY_PRIORITY.__getitem__)]
     return None
 
 def extract_location(q: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
-    qn = normalize(q)
-    zones, cities, _ = _load_geo_catalog()
-    zone_match = next((vals for key, vals in zones.items() if key and key in qn), None)
+    return _extract_location(normalize(q))
+
+def _extract_location(qn: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    # Precedencia zona > ciudad; con autómata gana el nombre más largo de cada tipo
+    if _geo_automaton() is not None:
+        zone_match = _geo_longest(qn, "zone")
+    else:
+        zones, _, _ = _load_geo_catalog()
+        zone_match = next((vals for key, vals in zones.items() if key and key in qn), None)
     if zone_match:
         zone, city, country = zone_match
         return country, city, zone
-    city_match = next((vals for key, vals in cities.items() if key and key in qn), None)
+    if _geo_automaton() is not None:
+        city_match = _geo_longest(qn, "city")
+    else:
+        _, cities, _ = _load_geo_catalog()
+        city_match = next((vals for key, vals in cities.items() if key and key in qn), None)
     if city_match:
         city, country = city_match
         return country, city, None
     return None, None, None
 
 def extract_zone_type(q: str) -> Optional[str]:
-    qn = normalize(q)
-    has_wealthy = any(w in qn for w in ["wealthy", "rica", "altas rentas"])
-    has_non_wealthy = any(w in qn for w in ["non wealthy", "non-wealthy", "no rica", "popular"])
+    return _extract_zone_type(normalize(q))
+
+def _extract_zone_type(qn: str) -> Optional[str]:
+    has_wealthy = _RE_WEALTHY.search(qn) is not None
+    has_non_wealthy = _RE_NON_WEALTHY.search(qn) is not None
     if has_wealthy and has_non_wealthy:
         return None
     if has_wealthy:
@@ -213,87 +335,122 @@ def extract_zone_type(q: str) -> Optional[str]:
     return None
 
 def mentions_zone_segments(q: str) -> bool:
-    qn = normalize(q)
-    return any(w in qn for w in ["wealthy", "non wealthy", "non-wealthy", "rica", "no rica", "popular"])
+    return _mentions_zone_segments(normalize(q))
+
+def _mentions_zone_segments(qn: str) -> bool:
+    return _RE_SEGMENT.search(qn) is not None
 
 def extract_topk(q: str) -> Optional[int]:
-    nq = normalize(q)
-    m = re.search(r"\b(top|bottom|mejores?|peores?)\s+(\d+)\b", nq)
+    return _extract_topk(normalize(q))
+
+def _extract_topk(nq: str) -> Optional[int]:
+    m = _RE_TOPK_NUM.search(nq)
     if m:
         return int(m.group(2))
-    m2 = re.search(r"\b(\d+)\s+zonas?\b", nq)
+    m2 = _RE_N_ZONAS.search(nq)
     if m2:
         return int(m2.group(1))
-    m3 = re.search(rf"\b(top|bottom|mejores?|peores?)\s+({NUMBER_WORD_PATTERN})\b", nq)
+    m3 = _RE_TOPK_WORD.search(nq)
     if m3:
         return SPANISH_NUMBER_WORDS[m3.group(2)]
     return None
 
 def ask_is_this_week(q: str) -> bool:
-    qn = normalize(q)
-    return any(w in qn for w in ["esta semana", "semana actual"])
+    return _ask_is_this_week(normalize(q))
+
+def _ask_is_this_week(qn: str) -> bool:
+    return _RE_THIS_WEEK.search(qn) is not None
 
 def ask_last_n_weeks(q: str) -> Optional[int]:
-    qn = normalize(q)
-    m = re.search(r"(ultim[oa]s?|últim[oa]s?)\s+(\d+)\s+semanas?", qn)
+    return _ask_last_n_weeks(normalize(q))
+
+def _ask_last_n_weeks(qn: str) -> Optional[int]:
+    m = _RE_LAST_N.search(qn)
     if m:
         return int(m.group(2))
-    m2 = re.search(rf"(ultim[oa]s?|últim[oa]s?)\s+({NUMBER_WORD_PATTERN})\s+semanas?", qn)
+    m2 = _RE_LAST_N_WORD.search(qn)
     if m2:
         return SPANISH_NUMBER_WORDS[m2.group(2)]
     return None
 
 def detect_task(q: str) -> str:
-    qn = normalize(q)
-    if any(w in qn for w in ["compara", "comparar", "diferencia entre"]):
+    return _detect_task(normalize(q))
+
+def _detect_task(qn: str) -> str:
+    # Una pasada del regex recoge todas las tareas mencionadas; la precedencia se aplica después
+    found = {m.lastgroup for m in _RE_TASK.finditer(qn)}
+    if "compare" in found:
         return "compare"
-    if any(w in qn for w in ["evolucion", "tendencia", "trend"]):
+    if "trend" in found:
         return "trend"
-    if any(w in qn for w in ["promedio", "media", "suma", "total"]):
+    if "aggregate" in found:
         return "aggregate"
     if "alto" in qn and "bajo" in qn:
         return "multivariable"
-    if any(w in qn for w in ["crecen", "crecimiento", "aumentan", "suben"]):
+    if "inference" in found:
         return "inference"
-    if "zonas problem" in qn or "problematic" in qn:
+    if "contextual" in found:
         return "contextual"
-    if any(w in qn for w in ["top", "bottom", "mayor", "menor", "mejores", "peores"]):
-        return "filter"
+    # top/bottom/mayor/menor/mejores/peores o nada: filter
     return "filter"
 
 # ---------------------------------------------------------------------
 # Reglas → AnalyticsSpec (integrado con catálogo YAML)
 # ---------------------------------------------------------------------
+_ZONE_TYPES = (None, "Wealthy", "Non Wealthy", "Non-Wealthy")  # = Literal de Filters.zone_type
+
 def to_spec(question: str, memory: dict) -> AnalyticsSpec:
+    """
+    Reglas → AnalyticsSpec, memoizado por (pregunta normalizada, memoria).
+    Parser y catálogo usan el mismo `normalize`, así que la forma normalizada basta como clave.
+    Devuelve siempre una copia profunda: los callers mutan el spec.
+    """
+    key = normalize(question)
+    try:
+        memory_key = tuple(sorted((memory or {}).items()))
+        hash(memory_key)
+    except TypeError:
+        # memoria con valores no hashables: sin caché
+        return _to_spec(key, memory)
+    return _to_spec_cached(key, memory_key).model_copy(deep=True)
+
+@lru_cache(maxsize=512)
+def _to_spec_cached(question: str, memory_key: tuple) -> AnalyticsSpec:
+    return _to_spec(question, dict(memory_key))
+
+def _to_spec(question: str, memory: dict) -> AnalyticsSpec:
+    # Normaliza una sola vez; los helpers privados reciben el texto ya normalizado
+    qn = normalize(question)
+
     # 1) Métrica desde catálogo (con fallback legado)
     cat_match = match_metric_from_catalog(question)
     if cat_match:
         data_metric, mprops = cat_match
     else:
-        canonical_metric = match_metric(question) or "Orders"
+        canonical_metric = _match_metric(qn) or "Orders"
         data_metric = normalize_canonical_metric_for_data(canonical_metric)
         mprops = props_for_metric(data_metric)
 
     # 2) Intent y ubicación
-    task = detect_task(question)
-    detected_country = extract_country(question)
-    loc_country, loc_city, loc_zone = extract_location(question)
+    task = _detect_task(qn)
+    detected_country = _extract_country(qn)
+    loc_country, loc_city, loc_zone = _extract_location(qn)
 
     country = (loc_country or detected_country)  # evita “país pegado”
     city = loc_city or memory.get("city")
     zone = loc_zone or memory.get("zone")
-    zone_type = extract_zone_type(question) or memory.get("zone_type")
-    segment_mentioned = mentions_zone_segments(question)
+    zone_type = _extract_zone_type(qn) or memory.get("zone_type")
+    segment_mentioned = _mentions_zone_segments(qn)
 
     # 3) TopK y orden
-    topk = extract_topk(question)
-    order, n_from_text = decide_order_and_n(question)
+    topk = _extract_topk(qn)
+    order, n_from_text = _decide_order_and_n(qn)
     if topk is None and n_from_text:
         topk = n_from_text
 
     # 4) Tiempo
-    time_range = "L0W" if ask_is_this_week(question) else "L8W-L0W"
-    n_last = ask_last_n_weeks(question)
+    time_range = "L0W" if _ask_is_this_week(qn) else "L8W-L0W"
+    n_last = _ask_last_n_weeks(qn)
     if n_last and 1 <= n_last <= 12:
         time_range = f"L{n_last}W-L0W"
 
@@ -316,20 +473,28 @@ def to_spec(question: str, memory: dict) -> AnalyticsSpec:
         visualization = "line"
 
     # 6) Construye spec base (contexto con metadatos de la métrica)
+    # Todos los valores salen de nuestros extractores (ya canónicos): model_construct evita
+    # re-validar en cada pregunta. Solo zone_type puede venir crudo desde la memoria.
     explicit_country = bool(country)
-    spec = AnalyticsSpec(
+    zone_type = Filters._coerce_zone_type(zone_type)
+    if zone_type in _ZONE_TYPES:
+        filters = Filters.model_construct(country=country, city=city, zone=zone, zone_type=zone_type)
+    else:
+        filters = Filters(country=country, city=city, zone=zone, zone_type=zone_type)
+    spec = AnalyticsSpec.model_construct(
         task=task,
         metrics=[data_metric],  # nombre real de data desde el catálogo
-        filters=Filters(country=country, city=city, zone=zone, zone_type=zone_type),
+        filters=filters,
         group_by=group_by,
-        time=TimeSpec(
+        time=TimeSpec.model_construct(
             range=time_range,
-            compare_to="prev_week" if "semana pasada" in normalize(question) else "none",
+            compare_to="prev_week" if "semana pasada" in qn else "none",
         ),
-        ops=Ops(
+        ops=Ops.model_construct(
             top_k=topk,
-            agg="mean" if "promedio" in normalize(question) else None,
-            order=order
+            agg="mean" if "promedio" in qn else None,
+            order=order,
+            explain=False,
         ),
         visualization=visualization,
         context={
@@ -349,7 +514,6 @@ def to_spec(question: str, memory: dict) -> AnalyticsSpec:
     # ---------------------------
     # OVERRIDES de negocio
     # ---------------------------
-    qn = normalize(question)
 
     if spec.task == "multivariable":
         spec.metrics = ["Lead Penetration", "Perfect Orders"]
@@ -364,7 +528,7 @@ def to_spec(question: str, memory: dict) -> AnalyticsSpec:
     if spec.task == "inference" or ("orden" in qn or "orders" in qn or "pedidos" in qn):
         if any(w in qn for w in ["crec", "crecim", "aument", "sub"]):
             spec.metrics = ["Orders"]
-            if not ask_last_n_weeks(question):
+            if not _ask_last_n_weeks(qn):
                 spec.time.range = "L5W-L0W"
 
     # Limpieza final: si agrupas por país, NO arrastres filtro de país
@@ -398,8 +562,6 @@ def to_spec_llm(question: str, memory: dict) -> AnalyticsSpec:
         data = loads(resp.output_text)
         spec = AnalyticsSpec(**data)
 
-        fallback = to_spec(question, memory)
-
         if spec.task == "multivariable":
             spec.metrics = ["Lead Penetration", "Perfect Orders"]
             try:
@@ -410,16 +572,21 @@ def to_spec_llm(question: str, memory: dict) -> AnalyticsSpec:
             except Exception:
                 pass
 
-        if spec.task == "inference" or ("orden" in normalize(question) or "orders" in normalize(question)):
-            if any(w in normalize(question) for w in ["crec", "crecim", "aument", "sub"]):
+        qn = normalize(question)
+        if spec.task == "inference" or ("orden" in qn or "orders" in qn):
+            if any(w in qn for w in ["crec", "crecim", "aument", "sub"]):
                 spec.metrics = ["Orders"]
-                if not ask_last_n_weeks(question):
+                if not _ask_last_n_weeks(qn):
                     spec.time.range = "L5W-L0W"
 
-        if not getattr(spec.ops, "order", None):
-            spec.ops.order = fallback.ops.order
-        if not getattr(spec.ops, "top_k", None):
-            spec.ops.top_k = fallback.ops.top_k
+        # Huecos en order/top_k: mismos extractores que usa to_spec, sin correr el parser completo
+        if not getattr(spec.ops, "order", None) or not getattr(spec.ops, "top_k", None):
+            order, n_from_text = _decide_order_and_n(qn)
+            if not getattr(spec.ops, "order", None):
+                spec.ops.order = order
+            if not getattr(spec.ops, "top_k", None):
+                topk = _extract_topk(qn)
+                spec.ops.top_k = n_from_text if (topk is None and n_from_text) else topk
         if spec.task == "trend" and ("week" not in (spec.group_by or [])):
             spec.group_by = ["week"]
         if spec.filters and spec.filters.zone_type == "Non-Wealthy":
@@ -3,6 +3,14 @@ from typing import List, Optional, Literal, Dict, Any
 from pydantic import BaseModel, Field, field_validator
 import re
 
+# Canonicalización de zone_type: separadores → espacio y lookup directo
+_SEPS = re.compile(r"[-_\s]+")
+_ZONE_MAP = {
+    "non wealthy": "Non Wealthy",
+    "no wealthy": "Non Wealthy",
+    "nonwealthy": "Non Wealthy",
+}
+
 TaskType = Literal["filter", "compare", "trend", "aggregate", "multivariable", "inference", "contextual"]
 
 
@@ -28,23 +36,15 @@ class Filters(BaseModel):
         - Soporta: "WEALTHY", "WeAlThY", etc.
         Devuelve "Non Wealthy" o "Wealthy" (formas canónicas incluidas en Literal).
         """
-        if v is None:
-            return v
         if not isinstance(v, str):
             return v
 
-        s = v.strip().lower()
-        # homogeneiza separadores a espacio
-        s = re.sub(r"[-_]+", " ", s)
-        s = re.sub(r"\s+", " ", s).strip()
-        # variante sin espacios para capturar "nonwealthy"
-        s_nospace = s.replace(" ", "")
-
-        # Mapeos a canónicos
-        # "nonwealthy" y similares -> "Non Wealthy"
-        if s_nospace in {"nonwealthy", "non-weal thy".replace(" ", ""), "non_wealthy".replace("_", "")} \
-           or s in {"non wealthy", "no wealthy"}:
-            return "Non Wealthy"
+        # homogeneiza separadores (-, _, espacios) a un espacio en una pasada
+        s = _SEPS.sub(" ", v.strip().lower()).strip()
+        # "nonwealthy" se captura por la variante sin espacios
+        hit = _ZONE_MAP.get(s) or _ZONE_MAP.get(s.replace(" ", ""))
+        if hit:
+            return hit
 
         # Si contiene 'wealthy' pero no empieza por 'non' => "Wealthy"
         if "wealthy" in s and not s.startswith("non"):
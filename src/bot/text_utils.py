@@ -0,0 +1,25 @@
+# src/bot/text_utils.py
+from __future__ import annotations
+
+import unicodedata
+from functools import lru_cache
+
+# Tabla de acentos del dominio (español), construida una vez al importar.
+# Cubre á é í ó ú ü ñ y sus mayúsculas; se omite a propósito la normalización
+# Unicode completa (NFD) salvo que quede algún otro carácter no ASCII.
+# Los espacios no necesitan tabla: normalize() los colapsa con split().
+_ACCENT_TABLE = str.maketrans("áéíóúüñÁÉÍÓÚÜÑ", "aeiouunAEIOUUN")
+
+def _strip_accents(text: str) -> str:
+    # Camino rápido (C): tabla con las letras acentuadas del español
+    out = text.translate(_ACCENT_TABLE)
+    if out.isascii():
+        return out
+    # Otros diacríticos (à, ç, ...): descomposición NFD completa
+    return "".join(c for c in unicodedata.normalize("NFD", out) if unicodedata.category(c) != "Mn")
+
+@lru_cache(maxsize=4096)
+def normalize(text: str) -> str:
+    """minúsculas + sin acentos + espacios colapsados (compartido por parser y catálogo)."""
+    # split() sin argumentos colapsa cualquier racha de espacios y recorta extremos
+    return " ".join(_strip_accents(text.lower()).split())
@@ -12,3 +12,6 @@ LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 DATA_RAW = BASE_DIR / "data" / "raw"
 DATA_PROCESSED = BASE_DIR / "data" / "processed"
 DUCKDB_PATH = DATA_PROCESSED / "warehouse.duckdb"
+DUCKDB_POOL_SIZE = int(os.getenv("DUCKDB_POOL_SIZE", "4"))
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", "0"))  # 0 = lo que decida DuckDB (núcleos)
+API_THREADPOOL_SIZE = int(os.getenv("API_THREADPOOL_SIZE", "64"))
@@ -1,6 +1,73 @@
+import queue
+import threading
+from contextlib import contextmanager
 import duckdb
-from src.config import DUCKDB_PATH
+from src.config import DUCKDB_PATH, DUCKDB_POOL_SIZE, DUCKDB_THREADS
 
-def get_conn():
-    return duckdb.connect(str(DUCKDB_PATH), read_only=True)
+_CONN = None
+_CONN_LOCK = threading.Lock()
 
+def configure(con: duckdb.DuckDBPyConnection) -> duckdb.DuckDBPyConnection:
+    """Ajustes de la instancia: cache de metadata entre consultas e hilos (DUCKDB_THREADS)."""
+    con.execute("SET enable_object_cache = true")
+    if DUCKDB_THREADS > 0:
+        con.execute(f"SET threads = {DUCKDB_THREADS:d}")
+    return con
+
+def get_conn() -> duckdb.DuckDBPyConnection:
+    """
+    Conexión read-only compartida por todo el proceso (singleton).
+    No la cierres: pide un cursor por request con `get_conn().cursor()`.
+    """
+    global _CONN
+    if _CONN is None:
+        with _CONN_LOCK:
+            if _CONN is None:
+                _CONN = configure(duckdb.connect(str(DUCKDB_PATH), read_only=True))
+    return _CONN
+
+
+class DuckPool:
+    """
+    Pool acotado de cursores sobre la conexión compartida.
+    Cada cursor es un handle independiente: hasta `size` consultas corren en paralelo.
+    """
+
+    def __init__(self, size: int) -> None:
+        self._cursors: queue.Queue = queue.Queue(maxsize=size)
+        con = get_conn()
+        for _ in range(size):
+            self._cursors.put(con.cursor())
+
+    @contextmanager
+    def acquire(self):
+        """
+        Presta un cursor; bloquea si todos están en uso.
+        Si la consulta falla, el cursor se cierra y se repone uno nuevo:
+        el pool nunca pierde capacidad ni reparte un handle en mal estado.
+        """
+        cur = self._cursors.get()
+        try:
+            yield cur
+        except BaseException:
+            try:
+                cur.close()
+            except Exception:
+                pass
+            cur = get_conn().cursor()
+            raise
+        finally:
+            self._cursors.put(cur)
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def get_pool() -> DuckPool:
+    """Pool del proceso (DUCKDB_POOL_SIZE cursores), creado en el primer uso."""
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = DuckPool(DUCKDB_POOL_SIZE)
+    return _POOL
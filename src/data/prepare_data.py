@@ -8,6 +8,11 @@ DATA_PROCESSED.mkdir(parents=True, exist_ok=True)
 
 EXCEL_FILE = "metrics.xlsx"  # <-- cambia aquí si tu archivo se llama distinto
 
+# Orden físico del parquet/tabla: filas de una misma zona/métrica/semana quedan juntas
+# y los min/max por row group permiten saltar bloques al filtrar por esas columnas.
+CLUSTER_KEYS = ["country", "city", "zone", "metric", "week_offset"]
+ROW_GROUP_SIZE = 100_000
+
 def _normalize_columns(df: pl.DataFrame) -> pl.DataFrame:
     mapping = {c: str(c).strip().lower().replace(" ", "_") for c in df.columns}
     return df.rename(mapping)
@@ -17,25 +22,28 @@ def read_source() -> pl.DataFrame:
     if not xlsx.exists():
         raise FileNotFoundError(f"No encuentro {xlsx}. Pon tu archivo en data/raw/")
 
-    # 1) Intento con Polars (rápido). Puede devolver un dict si hay varias hojas.
+    # 1) Polars con calamine (lector Rust vía fastexcel). sheet_id=1 = solo la primera hoja.
     try:
-        df_or_dict = pl.read_excel(xlsx, sheet_id=0)  # usa 0 (primera hoja)
-        if isinstance(df_or_dict, dict):              # si devuelve dict, toma la primera hoja
-            first_key = next(iter(df_or_dict))
-            df = df_or_dict[first_key]
-        else:
-            df = df_or_dict
+        df = pl.read_excel(xlsx, sheet_id=1, engine="calamine")
     except Exception:
-        # 2) Fallback estable con Pandas + openpyxl → luego convertimos a Polars
-        pdf = pd.read_excel(xlsx, sheet_name=0, engine="openpyxl")
-        df = pl.from_pandas(pdf)
+        # 2) fastexcel directo → Arrow → Polars (sin pasar por objetos Python)
+        try:
+            import fastexcel
+            df = pl.from_arrow(fastexcel.read_excel(str(xlsx)).load_sheet(0).to_arrow())
+        except Exception:
+            # 3) Último recurso: Pandas + openpyxl (puro Python, lento) → Polars
+            pdf = pd.read_excel(xlsx, sheet_name=0, engine="openpyxl")
+            df = pl.from_pandas(pdf)
 
     df = _normalize_columns(df)
     return df
 
 def persist(df: pl.DataFrame):
     pq = DATA_PROCESSED / "metrics.parquet"
-    df.write_parquet(pq)
+    keys = [c for c in CLUSTER_KEYS if c in df.columns]
+    if keys:
+        df = df.sort(keys)
+    df.write_parquet(pq, row_group_size=ROW_GROUP_SIZE)
 
     con = duckdb.connect(str(DUCKDB_PATH))
     con.execute("CREATE SCHEMA IF NOT EXISTS ops;")
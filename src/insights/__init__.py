@@ -1,3 +1,3 @@
 # src/insights/__init__.py
-__all__ = ["config", "engine", "report"]
+__all__ = ["config", "engine", "kernels", "report"]
 
@@ -1,21 +1,22 @@
 # src/insights/engine.py
 from __future__ import annotations
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, fields
 from typing import List, Dict, Any, Optional
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import duckdb
-import pandas as pd
 import numpy as np
-from scipy.stats import linregress, spearmanr
+from scipy.stats import rankdata
 
+from src.config import DUCKDB_PATH
+from src.data.db import get_conn
+from .kernels import ols_slope_r2_rows, trend_rows
 from .config import (
     METRIC_POLARITY, ANOMALY_WOW_THRESHOLD, TREND_MIN_RUN, TREND_MIN_R2,
     BENCHMARK_Z_ABS, CORR_MIN_ABS, MIN_POINTS_TIME, TOP_N, RECO_TEMPLATES
 )
 
-DUCK = "data/processed/warehouse.duckdb"
-
-@dataclass
+@dataclass(slots=True)
 class Insight:
     category: str              # "anomaly" | "trend" | "benchmark" | "correlation" | "opportunity"
     country: Optional[str]
@@ -28,21 +29,13 @@ class Insight:
     recommendation: str
     extra: Dict[str, Any]      # payload adicional
 
-def _pct_change(cur: float, prev: float) -> Optional[float]:
-    if prev is None or pd.isna(prev) or prev == 0:
-        return None
-    return (cur - prev) / abs(prev)
-
-def _run_length(seq: List[float], direction: str) -> int:
-    if len(seq) < 2:
-        return 0
-    run = 0
-    for i in range(len(seq)-1, 0, -1):
-        diff = seq[i] - seq[i-1]
-        if direction == "down" and diff < 0: run += 1
-        elif direction == "up" and diff > 0: run += 1
-        else: break
-    return run
+_INSIGHT_FIELDS = tuple(f.name for f in fields(Insight))
+
+def _as_dict(x: Insight) -> Dict[str, Any]:
+    """asdict sin deepcopy: Insight no anida dataclasses, basta copiar `extra` (superficial)."""
+    d = {name: getattr(x, name) for name in _INSIGHT_FIELDS}
+    d["extra"] = dict(x.extra)
+    return d
 
 def _severity_from_pct(p: float) -> float:
     return min(1.0, abs(p) / 0.20)  # 10% => 0.5 ; 20% => 1.0
@@ -55,129 +48,182 @@ def _severity_from_slope(slope: float, scale: float) -> float:
         return min(1.0, abs(slope))
     return min(1.0, abs(slope) / (0.5 * scale))
 
-def _open_con():
-    if not Path(DUCK).exists():
-        raise RuntimeError("No existe data/processed/warehouse.duckdb. Corre src/data/prepare_data.py")
-    con = duckdb.connect(DUCK, read_only=True)
-    con.execute("LOAD parquet;")
-    return con
-
-def _fetch_current_prev(con) -> pd.DataFrame:
+def _fetch_current_prev(con) -> List[tuple]:
+    """
+    Semana actual vs anterior con el cambio % ya calculado en DuckDB;
+    solo vuelven las filas que superan el umbral de anomalía.
+    El source trae filas duplicadas exactas: cur/prev se reducen a una fila por
+    (zona, métrica) antes del JOIN para no multiplicar la misma anomalía.
+    """
     sql = """
     WITH cur AS (
-      SELECT COUNTRY, CITY, ZONE, METRIC, VALUE
+      SELECT COUNTRY, CITY, ZONE, METRIC, any_value(VALUE) AS VALUE
       FROM zone_weekly_metrics WHERE WEEK_OFFSET=0
+      GROUP BY COUNTRY, CITY, ZONE, METRIC
     ),
     prev AS (
-      SELECT COUNTRY, CITY, ZONE, METRIC, VALUE AS prev_value
+      SELECT COUNTRY, CITY, ZONE, METRIC, any_value(VALUE) AS prev_value
       FROM zone_weekly_metrics WHERE WEEK_OFFSET=1
+      GROUP BY COUNTRY, CITY, ZONE, METRIC
+    ),
+    joined AS (
+      SELECT c.COUNTRY, c.CITY, c.ZONE, c.METRIC, c.VALUE, p.prev_value,
+             (c.VALUE - p.prev_value) / abs(NULLIF(p.prev_value, 0)) AS pct
+      FROM cur c LEFT JOIN prev p
+      USING (COUNTRY, CITY, ZONE, METRIC)
     )
-    SELECT c.COUNTRY, c.CITY, c.ZONE, c.METRIC, c.VALUE, p.prev_value
-    FROM cur c LEFT JOIN prev p
-    USING (COUNTRY, CITY, ZONE, METRIC)
+    SELECT * FROM joined
+    WHERE abs(pct) >= ?
+    ORDER BY COUNTRY, CITY, ZONE, METRIC
     """
-    return con.execute(sql).df()
+    return con.execute(sql, [ANOMALY_WOW_THRESHOLD]).fetchall()
 
 def detect_anomalies(con) -> List[Insight]:
-    df = _fetch_current_prev(con)
     out: List[Insight] = []
-    for (country, city, zone, metric), g in df.groupby(["COUNTRY","CITY","ZONE","METRIC"]):
-        cur = g["VALUE"].iloc[0]
-        prev = g["prev_value"].iloc[0]
-        pct = _pct_change(cur, prev)
-        if pct is None:
-            continue
-        if abs(pct) >= ANOMALY_WOW_THRESHOLD:
-            pol = METRIC_POLARITY.get(metric, True)
-            direction = "mejora" if pct > 0 else "deterioro"
-            concerning = (pct < 0) if pol else (pct > 0)
-            sev = _severity_from_pct(pct)
-            title = f"{metric}: {direction} WoW de {pct:+.1%} en {zone} ({country})"
-            reco_key = f"{metric.replace(' ','_')}_low" if concerning else "Benchmark_negative"
-            recommendation = RECO_TEMPLATES.get(reco_key, "Profundizar causa raíz y plan de acción.")
-            out.append(Insight(
-                category="anomaly", country=country, city=city, zone=zone, metric=metric,
-                title=title,
-                summary=f"Semana actual vs anterior: {cur:.3f} vs {prev:.3f}. Umbral ±{ANOMALY_WOW_THRESHOLD:.0%}.",
-                severity=sev, recommendation=recommendation,
-                extra={"current": float(cur), "prev": float(prev), "pct_change": float(pct)}
-            ))
+    # Una fila por (zona, métrica, semana) garantizada en SQL: el GROUP BY de cur/prev
+    # reemplaza al groupby(...).iloc[0] original, que era el que colapsaba los duplicados.
+    for country, city, zone, metric, cur, prev, pct in _fetch_current_prev(con):
+        pol = METRIC_POLARITY.get(metric, True)
+        direction = "mejora" if pct > 0 else "deterioro"
+        concerning = (pct < 0) if pol else (pct > 0)
+        sev = _severity_from_pct(pct)
+        title = f"{metric}: {direction} WoW de {pct:+.1%} en {zone} ({country})"
+        reco_key = f"{metric.replace(' ','_')}_low" if concerning else "Benchmark_negative"
+        recommendation = RECO_TEMPLATES.get(reco_key, "Profundizar causa raíz y plan de acción.")
+        out.append(Insight(
+            category="anomaly", country=country, city=city, zone=zone, metric=metric,
+            title=title,
+            summary=f"Semana actual vs anterior: {cur:.3f} vs {prev:.3f}. Umbral ±{ANOMALY_WOW_THRESHOLD:.0%}.",
+            severity=sev, recommendation=recommendation,
+            extra={"current": float(cur), "prev": float(prev), "pct_change": float(pct)}
+        ))
     return sorted(out, key=lambda x: x.severity, reverse=True)
 
+def _stacked_series(gid: np.ndarray, vals: np.ndarray, min_points: int):
+    """
+    Series contiguas (filas ya ordenadas por grupo + semana; `gid` = id de grupo por fila)
+    apiladas por largo. Entrega (posición de inicio de cada serie, matriz (g, n)) para cada n >= min_points.
+    """
+    starts = np.flatnonzero(np.r_[True, gid[1:] != gid[:-1]])
+    sizes = np.diff(np.r_[starts, len(vals)])
+    for n in np.unique(sizes[sizes >= min_points]):
+        sel = starts[sizes == n]
+        yield sel, vals[sel[:, None] + np.arange(n)]
+
 def detect_trends(con) -> List[Insight]:
     sql = """
-    SELECT COUNTRY, CITY, ZONE, METRIC, WEEK_OFFSET, VALUE
+    SELECT COUNTRY, CITY, ZONE, METRIC, VALUE,
+           dense_rank() OVER (ORDER BY COUNTRY, CITY, ZONE, METRIC) AS GID
     FROM zone_weekly_metrics
     WHERE WEEK_OFFSET BETWEEN 0 AND 8
+      AND COUNTRY IS NOT NULL AND CITY IS NOT NULL AND ZONE IS NOT NULL AND METRIC IS NOT NULL
     ORDER BY COUNTRY, CITY, ZONE, METRIC, WEEK_OFFSET
     """
-    df = con.execute(sql).df()
+    tbl = con.execute(sql).fetch_arrow_table()
     out: List[Insight] = []
-    for (country, city, zone, metric), g in df.groupby(["COUNTRY","CITY","ZONE","METRIC"]):
-        vals = g.sort_values("WEEK_OFFSET")["VALUE"].to_numpy(dtype=float)
-        if len(vals) < MIN_POINTS_TIME:
-            continue
-        x = np.arange(len(vals))
-        slope, _, r, _, _ = linregress(x, vals)
-        run_down = _run_length(vals.tolist(), "down")
-        pol = METRIC_POLARITY.get(metric, True)
-        deterioro = (slope < 0 and pol) or (slope > 0 and not pol)
-        r2 = r**2
-        scale = float(np.nanstd(vals))
-        sev = _severity_from_slope(slope, scale)
-        if (deterioro and r2 >= TREND_MIN_R2) or (run_down >= TREND_MIN_RUN):
-            title = f"{metric}: tendencia desfavorable en {zone} ({country})"
-            summary = f"Pendiente: {slope:+.3f} (R²={r2:.2f}); {run_down} caídas consecutivas. Ventana: 8 semanas."
-            recommendation = RECO_TEMPLATES.get(f"{metric.replace(' ','_')}_low",
-                                                "Plan de recuperación con acciones semanales y monitoreo.")
-            out.append(Insight(
-                category="trend", country=country, city=city, zone=zone, metric=metric,
-                title=title, summary=summary, severity=sev,
-                recommendation=recommendation,
-                extra={"slope": float(slope), "r2": float(r2), "runs_down": run_down}
-            ))
+    if tbl.num_rows == 0:
+        return out
+
+    # Arrow → numpy solo para lo numérico; los textos se leen por posición al final
+    vals = np.asarray(tbl["VALUE"].to_numpy(), dtype=float)
+    country_a, city_a, zone_a, metric_a = (tbl[c].to_numpy() for c in ["COUNTRY", "CITY", "ZONE", "METRIC"])
+
+    hits = []  # (inicio de la serie, slope, r2, run_down, scale)
+    for sel, Y in _stacked_series(tbl["GID"].to_numpy(), vals, MIN_POINTS_TIME):
+        slope, r2, run_down = trend_rows(Y)
+        scale = np.nanstd(Y, axis=1)
+        pol = np.array([METRIC_POLARITY.get(m, True) for m in metric_a[sel]], dtype=bool)
+        deterioro = ((slope < 0) & pol) | ((slope > 0) & ~pol)
+        keep = (deterioro & (r2 >= TREND_MIN_R2)) | (run_down >= TREND_MIN_RUN)
+        hits.extend(zip(sel[keep], slope[keep], r2[keep], run_down[keep], scale[keep]))
+
+    for i, slope, r2, run_down, scale in sorted(hits, key=lambda h: h[0]):
+        country, city, zone, metric = country_a[i], city_a[i], zone_a[i], metric_a[i]
+        run_down = int(run_down)
+        sev = _severity_from_slope(slope, float(scale))
+        title = f"{metric}: tendencia desfavorable en {zone} ({country})"
+        summary = f"Pendiente: {slope:+.3f} (R²={r2:.2f}); {run_down} caídas consecutivas. Ventana: 8 semanas."
+        recommendation = RECO_TEMPLATES.get(f"{metric.replace(' ','_')}_low",
+                                            "Plan de recuperación con acciones semanales y monitoreo.")
+        out.append(Insight(
+            category="trend", country=country, city=city, zone=zone, metric=metric,
+            title=title, summary=summary, severity=sev,
+            recommendation=recommendation,
+            extra={"slope": float(slope), "r2": float(r2), "runs_down": run_down}
+        ))
     return sorted(out, key=lambda x: x.severity, reverse=True)
 
-def detect_benchmarking(con) -> List[Insight]:
-    # Chequea si existe ZONE_TYPE (si no, usa solo país)
-    has_zone_type = False
+_ZONE_TYPE_PROBE: Dict[int, bool] = {}
+_ZONE_TYPE_LOCK = threading.Lock()
+
+def _has_zone_type(con) -> bool:
+    """
+    ¿zone_weekly_metrics tiene ZONE_TYPE? El esquema no cambia entre corridas:
+    se consulta una vez por versión del warehouse (mtime del archivo).
+    Solo se memoiza un resultado definitivo; un fallo transitorio no queda cacheado.
+    """
+    try:
+        stamp = DUCKDB_PATH.stat().st_mtime_ns
+    except OSError:
+        stamp = -1
+    hit = _ZONE_TYPE_PROBE.get(stamp)
+    if hit is not None:
+        return hit
     try:
-        con.execute("SELECT ZONE_TYPE FROM zone_weekly_metrics WHERE WEEK_OFFSET=0 LIMIT 1").df()
-        has_zone_type = True
+        con.execute("SELECT ZONE_TYPE FROM zone_weekly_metrics WHERE WEEK_OFFSET=0 LIMIT 1").fetchone()
+        hit = True
+    except duckdb.BinderException:
+        # Columna inexistente: es el esquema, se puede cachear
+        hit = False
     except Exception:
-        has_zone_type = False
+        return False
+    with _ZONE_TYPE_LOCK:
+        _ZONE_TYPE_PROBE.clear()
+        _ZONE_TYPE_PROBE[stamp] = hit
+    return hit
+
+def detect_benchmarking(con) -> List[Insight]:
+    # Chequea si existe ZONE_TYPE (si no, usa solo país)
+    has_zone_type = _has_zone_type(con)
 
+    # z-score contra el peer group (grupo + métrica) con ventanas en DuckDB;
+    # grupos sin varianza y filas bajo el umbral se descartan en el QUALIFY
     group_cols = ["COUNTRY", "ZONE_TYPE"] if has_zone_type else ["COUNTRY"]
+    keys = ", ".join(group_cols + ["METRIC"])
+    not_null = " AND ".join(f"{c} IS NOT NULL" for c in group_cols + ["METRIC"])
+    # Una fila por zona/métrica antes de la ventana: los duplicados exactos del source
+    # sesgarían AVG/STDDEV_POP y repetirían el mismo hallazgo
+    zone_keys = ", ".join(group_cols + ["CITY", "ZONE", "METRIC"])
     sql = f"""
-    SELECT {", ".join(group_cols)}, ZONE, METRIC, VALUE
-    FROM zone_weekly_metrics
-    WHERE WEEK_OFFSET=0
+    WITH base AS (
+      SELECT {zone_keys}, any_value(VALUE) AS VALUE
+      FROM zone_weekly_metrics
+      WHERE WEEK_OFFSET=0 AND {not_null}
+      GROUP BY {zone_keys}
+    )
+    SELECT COUNTRY, ZONE, METRIC,
+           (VALUE - AVG(VALUE) OVER w) / (STDDEV_POP(VALUE) OVER w + 1e-9) AS z
+    FROM base
+    WINDOW w AS (PARTITION BY {keys})
+    QUALIFY STDDEV_POP(VALUE) OVER w > 0 AND ABS(z) >= ?
+    ORDER BY {keys}
     """
-    df = con.execute(sql).df()
+    hits = con.execute(sql, [BENCHMARK_Z_ABS]).fetchall()
     out: List[Insight] = []
 
-    for (grp_vals, metric), g in df.groupby([tuple(group_cols), "METRIC"]):
-        values = g["VALUE"].astype(float)
-        if values.std(ddof=0) == 0:  # evitar div/0
-            continue
-        mean = float(values.mean())
-        std = float(values.std(ddof=0)) + 1e-9
-        g = g.copy()
-        g["z"] = (values - mean) / std
-        for _, row in g.iterrows():
-            z_val = float(row["z"])
-            if abs(z_val) >= BENCHMARK_Z_ABS:
-                country = row["COUNTRY"]
-                zone = row["ZONE"]
-                title = f"{row['METRIC']}: desempeño {'alto' if z_val>0 else 'bajo'} vs pares en {zone} ({country})"
-                summary = f"z-score={z_val:+.2f} respecto al peer group ({'país + tipo' if has_zone_type else 'país'})."
-                reco = RECO_TEMPLATES.get("Benchmark_negative", "Auditar gaps vs pares y replicar buenas prácticas.")
-                out.append(Insight(
-                    category="benchmark", country=country, city=None, zone=zone, metric=row["METRIC"],
-                    title=title, summary=summary, severity=_severity_from_z(z_val),
-                    recommendation=reco,
-                    extra={"z": z_val, "peer_group": "country+zone_type" if has_zone_type else "country"}
-                ))
+    peer_label = "país + tipo" if has_zone_type else "país"
+    peer_group = "country+zone_type" if has_zone_type else "country"
+    reco = RECO_TEMPLATES.get("Benchmark_negative", "Auditar gaps vs pares y replicar buenas prácticas.")
+    for country, zone, metric, z_val in hits:
+        z_val = float(z_val)
+        title = f"{metric}: desempeño {'alto' if z_val>0 else 'bajo'} vs pares en {zone} ({country})"
+        summary = f"z-score={z_val:+.2f} respecto al peer group ({peer_label})."
+        out.append(Insight(
+            category="benchmark", country=country, city=None, zone=zone, metric=metric,
+            title=title, summary=summary, severity=_severity_from_z(z_val),
+            recommendation=reco,
+            extra={"z": z_val, "peer_group": peer_group}
+        ))
     return sorted(out, key=lambda x: x.severity, reverse=True)[:TOP_N * 2]
 
 def detect_correlations(con) -> List[Insight]:
@@ -185,68 +231,56 @@ def detect_correlations(con) -> List[Insight]:
     Calcula correlaciones por zona (serie temporal) entre pares de métricas que existan.
     Marca pares fuertes |ρ|>=CORR_MIN_ABS si hay puntos suficientes.
     """
-    # Qué métricas hay
-    metrics = con.execute("SELECT DISTINCT METRIC FROM zone_weekly_metrics").df()["METRIC"].tolist()
-    metrics = [m for m in metrics if isinstance(m, str)]
+    # Un solo PIVOT (zona x semana) para todo el warehouse; luego se parte por zona en pandas
+    keys = ["COUNTRY", "CITY", "ZONE"]
+    wide_all = con.execute("""
+    PIVOT (
+      SELECT COUNTRY, CITY, ZONE, WEEK_OFFSET, METRIC, VALUE
+      FROM zone_weekly_metrics
+      WHERE WEEK_OFFSET BETWEEN 0 AND 8 AND METRIC IS NOT NULL
+    )
+    ON METRIC USING max(VALUE)
+    GROUP BY COUNTRY, CITY, ZONE, WEEK_OFFSET
+    ORDER BY COUNTRY, CITY, ZONE, WEEK_OFFSET
+    """).df()
     out: List[Insight] = []
+    metric_cols = [c for c in wide_all.columns if c not in keys and c != "WEEK_OFFSET"]
 
-    # Obtener todas las zonas
-    zones = con.execute("SELECT DISTINCT COUNTRY, CITY, ZONE FROM zone_weekly_metrics").df()
-
-    for _, zr in zones.iterrows():
-        country, city, zone = zr["COUNTRY"], zr["CITY"], zr["ZONE"]
-
-        # Construir la lista de columnas condicionales SIN f-strings anidados
-        cols = []
-        for m in metrics:
-            safe_m = m.replace("'", "''")  # por si hay comillas simples en el nombre de la métrica
-            # Usamos .format para evitar backslashes en expresiones de f-strings
-            cols.append("MAX(CASE WHEN METRIC='{}' THEN VALUE END) AS \"{}\"".format(safe_m, m))
-        cols_expr = ", ".join(cols)
-
-        sql = f"""
-        WITH m AS (
-          SELECT WEEK_OFFSET, METRIC, VALUE
-          FROM zone_weekly_metrics
-          WHERE UPPER(COUNTRY)=UPPER('{country}')
-            AND UPPER(CITY)=UPPER('{city}')
-            AND UPPER(ZONE)=UPPER('{zone}')
-            AND WEEK_OFFSET BETWEEN 0 AND 8
-        )
-        SELECT WEEK_OFFSET,
-               {cols_expr}
-        FROM m
-        GROUP BY WEEK_OFFSET
-        ORDER BY WEEK_OFFSET
-        """
-        wide = con.execute(sql).df()
+    for (country, city, zone), wide in wide_all.groupby(keys, sort=False):
         if len(wide) < MIN_POINTS_TIME:
             continue
 
-        # Correlaciones por pares
-        cols = [c for c in wide.columns if c != "WEEK_OFFSET"]
-        for i in range(len(cols)):
-            for j in range(i + 1, len(cols)):
-                a, b = cols[i], cols[j]
-                if wide[a].isna().all() or wide[b].isna().all():
-                    continue
-                try:
-                    rho, _ = spearmanr(wide[a], wide[b], nan_policy='omit')
-                except Exception:
-                    continue
-                if rho is not None and not np.isnan(rho) and abs(rho) >= CORR_MIN_ABS:
-                    title = f"Correlación {a} ↔ {b} en {zone} ({country})"
-                    summary = f"ρ={rho:+.2f} con ≥{len(wide)} puntos (8-9 semanas)."
-                    reco_key = "Correlation_LP_PO" if set([a, b]) == set(["Lead Penetration", "Perfect Orders"]) else "Benchmark_negative"
-                    recommendation = RECO_TEMPLATES.get(reco_key, "Explorar causalidades y plan conjunto para mejorar ambas.")
-                    sev = min(1.0, (abs(rho) - CORR_MIN_ABS) / (1 - CORR_MIN_ABS + 1e-9))
-                    out.append(Insight(
-                        category="correlation",
-                        country=country, city=city, zone=zone, metric=None,
-                        title=title, summary=summary, severity=sev,
-                        recommendation=recommendation,
-                        extra={"rho": float(rho), "metrics": [a, b]}
-                    ))
+        # Métricas con algún dato en la zona; se rankea cada columna una vez
+        cols = [c for c in metric_cols if wide[c].notna().any()]
+        if len(cols) < 2:
+            continue
+        sub = wide[cols]
+        mat = sub.to_numpy(dtype=float)
+        if not np.isnan(mat).any():
+            # Spearman = Pearson sobre rangos: un rankdata 2D + un corrcoef
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rho_m = np.corrcoef(rankdata(mat, axis=0), rowvar=False)
+        else:
+            # Con huecos: Spearman por pares sobre observaciones completas (= nan_policy='omit')
+            rho_m = sub.corr(method="spearman").to_numpy()
+
+        iu, ju = np.triu_indices(len(cols), k=1)
+        rhos = rho_m[iu, ju]
+        keep = np.abs(rhos) >= CORR_MIN_ABS   # NaN (columna constante) queda fuera
+        for i, j, rho in zip(iu[keep], ju[keep], rhos[keep]):
+            a, b = cols[i], cols[j]
+            title = f"Correlación {a} ↔ {b} en {zone} ({country})"
+            summary = f"ρ={rho:+.2f} con ≥{len(wide)} puntos (8-9 semanas)."
+            reco_key = "Correlation_LP_PO" if set([a, b]) == set(["Lead Penetration", "Perfect Orders"]) else "Benchmark_negative"
+            recommendation = RECO_TEMPLATES.get(reco_key, "Explorar causalidades y plan conjunto para mejorar ambas.")
+            sev = min(1.0, (abs(rho) - CORR_MIN_ABS) / (1 - CORR_MIN_ABS + 1e-9))
+            out.append(Insight(
+                category="correlation",
+                country=country, city=city, zone=zone, metric=None,
+                title=title, summary=summary, severity=sev,
+                recommendation=recommendation,
+                extra={"rho": float(rho), "metrics": [a, b]}
+            ))
 
     # Top correlaciones
     out = sorted(out, key=lambda x: x.severity, reverse=True)[:TOP_N]
@@ -261,42 +295,46 @@ def detect_opportunities(con) -> List[Insight]:
     out: List[Insight] = []
     try:
         orders = con.execute("""
-        SELECT COUNTRY, CITY, ZONE, WEEK_OFFSET, ORDERS
+        SELECT COUNTRY, CITY, ZONE, ORDERS,
+               dense_rank() OVER (ORDER BY COUNTRY, CITY, ZONE) AS GID
         FROM zone_weekly_orders
         WHERE WEEK_OFFSET BETWEEN 0 AND 5
+          AND COUNTRY IS NOT NULL AND CITY IS NOT NULL AND ZONE IS NOT NULL
         ORDER BY COUNTRY, CITY, ZONE, WEEK_OFFSET
-        """).df()
+        """).fetch_arrow_table()
     except Exception:
         return out  # si no existe la vista, no reportamos oportunidades
 
-    for (country, city, zone), g in orders.groupby(["COUNTRY","CITY","ZONE"]):
-        g = g.sort_values("WEEK_OFFSET")
-        if len(g) < MIN_POINTS_TIME:
-            continue
-        x = np.arange(len(g))
-        slope, *_ = linregress(x, g["ORDERS"].astype(float))
-        if slope <= 0:
-            continue
-
-        po = con.execute("""
-        SELECT COUNTRY, CITY, ZONE, VALUE
-        FROM zone_weekly_metrics
-        WHERE WEEK_OFFSET=0 AND METRIC='Perfect Orders'
-        """).df()
-        po_country = po[po["COUNTRY"].str.upper()==country.upper()]
-        if po_country.empty: 
-            continue
-        p40 = float(po_country["VALUE"].quantile(0.40))
-
-        po_zone = po[(po["COUNTRY"].str.upper()==country.upper()) &
-                     (po["CITY"].str.upper()==city.upper()) &
-                     (po["ZONE"].str.upper()==zone.upper())]
-        if po_zone.empty:
+    # PO de L0W una sola vez: p40 por país y valor por zona (match sin mayúsculas)
+    po = con.execute("""
+    SELECT UPPER(COUNTRY) AS C, UPPER(CITY) AS CI, UPPER(ZONE) AS Z, VALUE
+    FROM zone_weekly_metrics
+    WHERE WEEK_OFFSET=0 AND METRIC='Perfect Orders'
+    """).df()
+    if orders.num_rows == 0 or po.empty:
+        return out
+    p40_by_country = po.groupby("C")["VALUE"].quantile(0.40)
+    po_by_zone = po.drop_duplicates(["C", "CI", "Z"]).set_index(["C", "CI", "Z"])["VALUE"]
+    vals = np.asarray(orders["ORDERS"].to_numpy(), dtype=float)
+    orders_std = np.nanstd(vals)
+
+    country_a, city_a, zone_a = (orders[c].to_numpy() for c in ["COUNTRY", "CITY", "ZONE"])
+    hits = []  # (inicio de la serie, slope)
+    for sel, Y in _stacked_series(orders["GID"].to_numpy(), vals, MIN_POINTS_TIME):
+        slope, _ = ols_slope_r2_rows(Y)
+        keep = slope > 0
+        hits.extend(zip(sel[keep], slope[keep]))
+
+    for i, slope in sorted(hits, key=lambda h: h[0]):
+        country, city, zone = country_a[i], city_a[i], zone_a[i]
+        p40 = p40_by_country.get(country.upper())
+        po_val = po_by_zone.get((country.upper(), city.upper(), zone.upper()))
+        if p40 is None or po_val is None:
             continue
-        po_val = float(po_zone["VALUE"].iloc[0])
+        p40, po_val = float(p40), float(po_val)
 
         if po_val < p40:
-            sev = min(1.0, abs(slope) / (np.nanstd(orders["ORDERS"]) + 1e-9))
+            sev = min(1.0, abs(slope) / (orders_std + 1e-9))
             out.append(Insight(
                 category="opportunity", country=country, city=city, zone=zone, metric="Perfect Orders",
                 title=f"Oportunidad: Órdenes creciendo pero PO bajo en {zone} ({country})",
@@ -314,33 +352,48 @@ def generate_insights(scope: Dict[str, Optional[str]] | None = None) -> Dict[str
     Nota: Hoy los detectores corren globalmente; si quieres, puedes pasar 'scope'
     a cada consulta DuckDB. Aquí solo robustecemos y evitamos fallos.
     """
-    con = _open_con()
+    if not DUCKDB_PATH.exists():
+        raise RuntimeError(f"No existe {DUCKDB_PATH}. Corre src/data/prepare_data.py")
+    # Conexión read-only compartida del proceso (la misma que usa la API)
+    con = get_conn()
 
     def _safe(name, fn):
+        # Cursor propio por detector: corren en paralelo sobre la conexión compartida
+        cur = None
         try:
-            return fn()
+            cur = con.cursor()
+            return fn(cur)
         except Exception as e:
             # Log suave a consola para que veas qué detector rompió y por qué,
             # pero nunca rompemos toda la respuesta.
             print(f"[insights:{name}] ERROR:", repr(e))
             return []
-
-    anomalies = _safe("anomalies", lambda: detect_anomalies(con))[:TOP_N]
-    trends    = _safe("trends",    lambda: detect_trends(con))[:TOP_N]
-    bench     = _safe("benchmark", lambda: detect_benchmarking(con))[:TOP_N]
-    corrs     = _safe("corrs",     lambda: detect_correlations(con))[:TOP_N]
-    opps      = _safe("opps",      lambda: detect_opportunities(con))[:TOP_N]
+        finally:
+            if cur is not None:
+                cur.close()
+
+    # DuckDB y numpy sueltan el GIL: los cinco detectores se solapan en hilos
+    detectors = [
+        ("anomalies", detect_anomalies),
+        ("trends",    detect_trends),
+        ("benchmark", detect_benchmarking),
+        ("corrs",     detect_correlations),
+        ("opps",      detect_opportunities),
+    ]
+    with ThreadPoolExecutor(max_workers=len(detectors)) as ex:
+        futs = {name: ex.submit(_safe, name, fn) for name, fn in detectors}
+    anomalies, trends, bench, corrs, opps = (futs[name].result()[:TOP_N] for name, _ in detectors)
 
     all_items = anomalies + trends + bench + corrs + opps
     executive = sorted(all_items, key=lambda x: x.severity, reverse=True)[:5]
 
     return {
-        "executive_summary": [asdict(x) for x in executive],
-        "anomalies": [asdict(x) for x in anomalies],
-        "trends": [asdict(x) for x in trends],
-        "benchmarking": [asdict(x) for x in bench],
-        "correlations": [asdict(x) for x in corrs],
-        "opportunities": [asdict(x) for x in opps],
+        "executive_summary": [_as_dict(x) for x in executive],
+        "anomalies": [_as_dict(x) for x in anomalies],
+        "trends": [_as_dict(x) for x in trends],
+        "benchmarking": [_as_dict(x) for x in bench],
+        "correlations": [_as_dict(x) for x in corrs],
+        "opportunities": [_as_dict(x) for x in opps],
         "meta": {"counts": {
             "executive": len(executive),
             "anomalies": len(anomalies),
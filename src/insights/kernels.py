@@ -0,0 +1,104 @@
+# src/insights/kernels.py
+from __future__ import annotations
+from typing import Tuple
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:  # numba es opcional: sin él los kernels corren como Python normal
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+
+@njit(cache=True)
+def ols_slope_r2(y: np.ndarray) -> Tuple[float, float]:
+    """Pendiente y R² de y contra x=0..n-1 (equivale a linregress(x, y) sin overhead de scipy)."""
+    n = y.shape[0]
+    x_mean = (n - 1) / 2.0
+    y_mean = 0.0
+    for i in range(n):
+        y_mean += y[i]
+    y_mean /= n
+    sxy = 0.0
+    sxx = 0.0
+    syy = 0.0
+    for i in range(n):
+        dx = i - x_mean
+        dy = y[i] - y_mean
+        sxy += dx * dy
+        sxx += dx * dx
+        syy += dy * dy
+    if sxx == 0.0:
+        return 0.0, 0.0
+    slope = sxy / sxx
+    if syy == 0.0:
+        return slope, 0.0
+    return slope, (sxy * sxy) / (sxx * syy)
+
+
+@njit(cache=True)
+def run_length(y: np.ndarray, up: bool) -> int:
+    """Nº de subidas (up) o caídas consecutivas al final de la serie."""
+    run = 0
+    for i in range(y.shape[0] - 1, 0, -1):
+        diff = y[i] - y[i - 1]
+        if (up and diff > 0) or (not up and diff < 0):
+            run += 1
+        else:
+            break
+    return run
+
+
+def ols_slope_r2_rows(Y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """`ols_slope_r2` por fila de Y (g, n) en bloque con numpy; NaN se propaga igual que en el escalar."""
+    n = Y.shape[1]
+    x = np.arange(n, dtype=float) - (n - 1) / 2.0
+    yc = Y - Y.mean(axis=1, keepdims=True)
+    sxy = yc @ x
+    sxx = float(x @ x)
+    syy = np.einsum("ij,ij->i", yc, yc)
+    if sxx == 0.0:
+        zeros = np.zeros(Y.shape[0])
+        return zeros, zeros.copy()
+    slope = sxy / sxx
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r2 = np.where(syy == 0.0, 0.0, (sxy * sxy) / (sxx * syy))
+    return slope, r2
+
+
+def run_length_rows(Y: np.ndarray, up: bool) -> np.ndarray:
+    """`run_length` por fila: cuenta subidas/caídas consecutivas desde el final (NaN corta la racha)."""
+    d = np.diff(Y, axis=1)
+    hit = (d > 0) if up else (d < 0)
+    return np.cumprod(hit[:, ::-1], axis=1).sum(axis=1)
+
+
+# Sin parallel=True: los detectores ya corren en hilos y la capa workqueue de numba
+# no admite lanzar prange desde varios hilos (se cuelga al salir del proceso).
+@njit(cache=True)
+def _trend_kernel(Y: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Pendiente, R² y caídas consecutivas finales por fila, en un solo recorrido."""
+    g = Y.shape[0]
+    slopes = np.empty(g)
+    r2 = np.empty(g)
+    runs = np.empty(g, np.int64)
+    for i in range(g):
+        slopes[i], r2[i] = ols_slope_r2(Y[i])
+        runs[i] = run_length(Y[i], False)
+    return slopes, r2, runs
+
+
+def trend_rows(Y: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (slope, r2, run_down) por fila de Y (g, n).
+    Con numba usa el kernel fusionado; sin numba, las versiones numpy en bloque.
+    """
+    if HAVE_NUMBA:
+        return _trend_kernel(np.ascontiguousarray(Y, dtype=np.float64))
+    slope, r2 = ols_slope_r2_rows(Y)
+    return slope, r2, run_length_rows(Y, False)
@@ -3,7 +3,14 @@ from __future__ import annotations
 from typing import Dict, Any, List
 from pathlib import Path
 from datetime import datetime
-import json
+import uuid
+import orjson
+
+try:
+    from markdown_it import MarkdownIt
+    _MD = MarkdownIt("commonmark", {"html": False})  # escapa HTML crudo de títulos/métricas
+except ImportError:  # markdown-it-py es opcional: sin él el HTML es el markdown con <br/>
+    _MD = None
 
 def _section_md(title: str) -> str:
     return f"\n## {title}\n"
@@ -11,11 +18,11 @@ def _section_md(title: str) -> str:
 def _list_md(items: List[Dict[str,Any]], limit=None) -> str:
     if not items:
         return "_Sin hallazgos relevantes._\n"
-    md = ""
-    for it in (items[:limit] if limit else items):
-        md += f"- **{it['title']}** — {it['summary']}  \n"
-        md += f"  *Recomendación:* {it['recommendation']}\n"
-    return md
+    return "".join(
+        f"- **{it['title']}** — {it['summary']}  \n"
+        f"  *Recomendación:* {it['recommendation']}\n"
+        for it in (items[:limit] if limit else items)
+    )
 
 def to_markdown(payload: Dict[str,Any], title="Reporte de Insights — Rappi Intelligent Ops") -> str:
     ts = datetime.now().strftime("%Y-%m-%d %H:%M")
@@ -41,19 +48,30 @@ def to_markdown(payload: Dict[str,Any], title="Reporte de Insights — Rappi Int
     md += "\n---\n_Métricas y criterios: ±10% WoW, ≥3 corridas, z≥1.5, |ρ|≥0.5._\n"
     return md
 
-def save_report(payload: Dict[str,Any], out_dir="reports", base_name="insights_report"):
+# id = fecha_hora con segundos + sufijo aleatorio: dos reportes en el mismo segundo no se pisan
+REPORT_ID_PATTERN = r"^\d{8}_\d{6}_[0-9a-f]{6}$"
+
+def report_id() -> str:
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+def report_paths(ts: str, out_dir="reports", base_name="insights_report") -> Dict[str, Path]:
+    return {
+        "markdown": Path(out_dir) / f"{base_name}_{ts}.md",
+        "html": Path(out_dir) / f"{base_name}_{ts}.html",
+        "json": Path(out_dir) / f"{base_name}_{ts}.json",
+    }
+
+def save_report(payload: Dict[str,Any], out_dir="reports", base_name="insights_report", ts: str | None = None):
     Path(out_dir).mkdir(parents=True, exist_ok=True)
     md = to_markdown(payload)
-    ts = datetime.now().strftime("%Y%m%d_%H%M")
-    md_path = Path(out_dir) / f"{base_name}_{ts}.md"
-    html_path = Path(out_dir) / f"{base_name}_{ts}.html"
-    json_path = Path(out_dir) / f"{base_name}_{ts}.json"
+    paths = report_paths(ts or report_id(), out_dir, base_name)
+    md_path, html_path, json_path = paths["markdown"], paths["html"], paths["json"]
 
     with open(md_path, "w", encoding="utf-8") as f:
         f.write(md)
 
     # Construimos el body HTML por separado para evitar backslashes en expresiones de f-strings
-    html_body = md.replace("\n", "<br/>\n")
+    html_body = _MD.render(md) if _MD is not None else md.replace("\n", "<br/>\n")
     html = (
         "<!doctype html><html><head>"
         '<meta charset="utf-8"><title>Reporte Insights</title>'
@@ -65,7 +83,9 @@ def save_report(payload: Dict[str,Any], out_dir="reports", base_name="insights_r
     with open(html_path, "w", encoding="utf-8") as f:
         f.write(html)
 
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    # orjson escribe bytes UTF-8 directo (sin escapar acentos); numpy por si algún extra lo trae
+    json_path.write_bytes(orjson.dumps(
+        payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    ))
 
     return {"markdown": str(md_path), "html": str(html_path), "json": str(json_path)}
@@ -0,0 +1,50 @@
+# tests/test_executor_contextual.py
+import duckdb
+import pytest
+
+from src.bot.executor import _execute
+from src.bot.schema import AnalyticsSpec
+
+ROWS = [
+    # (COUNTRY, CITY, ZONE, ZONE_TYPE, METRIC, WEEK_OFFSET, VALUE)
+    ("Colombia", "Bogota", "Z1", "Wealthy", "Lead Penetration", 0, 10.0),
+    ("Colombia", "Bogota", "Z1", "Wealthy", "Lead Penetration", 1, 20.0),
+    ("Colombia", "Bogota", "Z2", "Wealthy", "Lead Penetration", 0, 19.0),
+    ("Colombia", "Bogota", "Z2", "Wealthy", "Lead Penetration", 1, 20.0),
+    ("Colombia", "Bogota", "Z3", "Wealthy", "Perfect Orders", 0, 0.5),
+    ("Colombia", "Bogota", "Z3", "Wealthy", "Perfect Orders", 1, 0.8),
+]
+
+EXPECTED = [("Z1", "Lead Penetration", 10.0, 20.0, -0.5), ("Z3", "Perfect Orders", 0.5, 0.8, -0.375)]
+
+
+def _con(rows):
+    con = duckdb.connect()
+    con.execute("""
+        CREATE TABLE zone_weekly_metrics (
+          COUNTRY VARCHAR, CITY VARCHAR, ZONE VARCHAR, ZONE_TYPE VARCHAR,
+          METRIC VARCHAR, WEEK_OFFSET INTEGER, VALUE DOUBLE)
+    """)
+    con.executemany("INSERT INTO zone_weekly_metrics VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    return con
+
+
+def _contextual(con):
+    spec = AnalyticsSpec(task="contextual", metrics=["Lead Penetration"])
+    return _execute(spec, con)["data"]
+
+
+def _rows(data):
+    return [(r["ZONE"], r["METRIC"], r["VALUE"], r["prev_value"], pytest.approx(r["pct_change"]))
+            for r in data]
+
+
+def test_contextual_flags_wow_drop_and_low_po():
+    assert _rows(_contextual(_con(ROWS))) == EXPECTED
+
+
+def test_contextual_ignores_exact_duplicate_rows():
+    # Duplicados exactos de semana 0 y 1: el LAG no debe leer el duplicado de la propia semana
+    # (PO bajo pasaría igual el filtro, reportado con 0% de cambio)
+    dup = [r for r in ROWS if r[2] in ("Z1", "Z3")]
+    assert _rows(_contextual(_con(ROWS + dup))) == EXPECTED
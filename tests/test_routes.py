@@ -0,0 +1,19 @@
+# tests/test_routes.py
+from app.api.main import app
+
+
+def _paths() -> set:
+    # Rutas de la app ya montadas (incluye las de routers incluidos con su prefijo)
+    paths = {r.path for r in app.routes if hasattr(r, "path")}
+    return paths | set(app.openapi()["paths"])
+
+
+def test_metrics_and_timeseries_routers_are_registered():
+    paths = _paths()
+    assert "/metrics" in paths
+    assert "/timeseries/orders" in paths
+
+
+def test_core_routes_are_registered():
+    paths = _paths()
+    assert {"/health", "/chat", "/cache/invalidate", "/insights/", "/insights/files"} <= paths
@@ -0,0 +1,38 @@
+# tests/test_text_utils.py
+import unicodedata
+
+import pytest
+
+from src.bot.text_utils import _strip_accents, normalize
+
+# Letras que cubre la tabla rápida (_ACCENT_TABLE) y su forma esperada tras normalize()
+TABLE_CASES = {
+    "á": "a", "é": "e", "í": "i", "ó": "o", "ú": "u", "ü": "u", "ñ": "n",
+    "Á": "a", "É": "e", "Í": "i", "Ó": "o", "Ú": "u", "Ü": "u", "Ñ": "n",
+}
+
+
+@pytest.mark.parametrize("char,expected", TABLE_CASES.items())
+def test_normalize_covers_accent_table(char, expected):
+    assert normalize(char) == expected
+    assert normalize(f"  Zona {char}  X ") == f"zona {expected} x"
+
+
+@pytest.mark.parametrize("char", list(TABLE_CASES))
+def test_table_matches_full_nfd_strip(char):
+    # La tabla debe dar lo mismo que la normalización Unicode completa
+    nfd = "".join(c for c in unicodedata.normalize("NFD", char) if unicodedata.category(c) != "Mn")
+    assert _strip_accents(char) == nfd
+
+
+@pytest.mark.parametrize("text,expected", [
+    ("ç", "c"),
+    ("à", "a"),
+    ("Curaçao à São Paulo", "curacao a sao paulo"),
+])
+def test_normalize_falls_back_to_nfd(text, expected):
+    assert normalize(text) == expected
+
+
+def test_normalize_mixed_table_and_fallback():
+    assert normalize("Pedidos  en   Bogotá y Curaçao") == "pedidos en bogota y curacao"